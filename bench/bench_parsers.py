@@ -0,0 +1,302 @@
+#! /usr/bin/env python
+"""
+Benchmarks scholar.py's results-page parsers over the HTML fixtures in
+bench/fixtures. A fixture's name prefix selects the parser class
+matching its page layout:
+
+  original-*  ScholarArticleParser
+  120201-*    ScholarArticleParser120201
+  120726-*    ScholarArticleParser120726
+
+Each parser runs with every parser engine it supports, and with
+--stream also parses pages incrementally via feed(). For every
+combination the benchmark reports pages/sec, articles/sec, peak memory
+of a single parse, and the time spent per phase: building the parse
+tree, parsing global results, parsing individual articles, and the
+rest (locating result entries, cleanup, callbacks).
+
+Use --json to save results for later comparison via --compare, e.g.
+across commits.
+
+Use --check to verify the parsers' output instead: every fixture comes
+with its expected output, the articles and result count in a JSON file
+of the same name. --update-expected rewrites those files from the
+current output of the BeautifulSoup engine, after deliberate changes.
+"""
+# Don't complain about missing docstrings: pylint: disable-msg=C0111
+
+import glob
+import json
+import optparse
+import os
+import platform
+import subprocess
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import scholar # pylint: disable-msg=C0413
+
+PARSERS = {
+    'original': scholar.ScholarArticleParser,
+    '120201': scholar.ScholarArticleParser120201,
+    '120726': scholar.ScholarArticleParser120726,
+}
+
+PHASES = ('build', 'globals', 'articles', 'other')
+
+# Chunk size for incremental parsing, as when reading responses:
+CHUNK_SIZE = scholar.ScholarConf.READ_CHUNK_SIZE
+
+
+class PhaseTimer(object):
+    """
+    Accumulates time spent in the parsing phases, by wrapping the
+    relevant parser methods and SoupKitchen factories.
+    """
+    def __init__(self):
+        self.times = dict((phase, 0.0) for phase in PHASES)
+        self._saved = {}
+
+    def timed(self, phase, func):
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.times[phase] += time.time() - start
+        return wrapper
+
+    def wrap(self, parser):
+        for name, phase in (('_parse_globals', 'globals'),
+                            ('_parse_globals_tree', 'globals'),
+                            ('_parse_article', 'articles'),
+                            ('_parse_article_tree', 'articles')):
+            setattr(parser, name, self.timed(phase, getattr(parser, name)))
+        return parser
+
+    def install(self):
+        for name in ('make_soup', 'make_tree'):
+            self._saved[name] = getattr(scholar.SoupKitchen, name)
+            setattr(scholar.SoupKitchen, name,
+                    staticmethod(self.timed('build', self._saved[name])))
+
+    def uninstall(self):
+        for name, func in self._saved.items():
+            setattr(scholar.SoupKitchen, name, staticmethod(func))
+        self._saved = {}
+
+
+def make_parser(parser_class, engine, articles=None):
+    parser = parser_class(engine=engine)
+    if articles is not None:
+        parser.handle_article = lambda art: articles.append(art.as_dict())
+    return parser
+
+def run_parser(parser, html, stream=False):
+    if not stream:
+        parser.parse(html)
+        return
+    for start in range(0, len(html), CHUNK_SIZE):
+        if not parser.feed(html[start:start + CHUNK_SIZE]):
+            break
+
+def get_engines(parser_class):
+    engines = [scholar.SoupKitchen.ENGINE_BS4]
+    if parser_class.SUPPORTS_LXML and scholar.lxml_html.is_available():
+        engines.append(scholar.SoupKitchen.ENGINE_LXML)
+    return engines
+
+def bench(parser_class, engine, html, min_time, min_rounds, stream=False):
+    # Count articles once, outside of the timed runs:
+    articles = []
+    run_parser(make_parser(parser_class, engine, articles), html, stream)
+
+    timer = PhaseTimer()
+    rounds = 0
+    total = 0.0
+    timer.install()
+    try:
+        while total < min_time or rounds < min_rounds:
+            parser = timer.wrap(make_parser(parser_class, engine))
+            start = time.time()
+            run_parser(parser, html, stream)
+            total += time.time() - start
+            rounds += 1
+    finally:
+        timer.uninstall()
+
+    timer.times['other'] = max(0.0, total - sum(timer.times.values()))
+
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        run_parser(make_parser(parser_class, engine), html, stream)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {'rounds': rounds,
+            'articles': len(articles),
+            'bytes': len(html),
+            'pages_per_sec': rounds / total,
+            'articles_per_sec': rounds * len(articles) / total,
+            'peak_memory': peak,
+            'phases_ms': dict((phase, 1000 * val / rounds)
+                              for phase, val in timer.times.items())}
+
+def get_output(parser_class, engine, html, stream=False):
+    """
+    Returns the parser's output for a page: a dictionary holding the
+    result count it reports and its articles, as in the fixtures'
+    expected output.
+    """
+    articles, counts = [], []
+    parser = make_parser(parser_class, engine, articles)
+    parser.handle_num_results = counts.append
+    run_parser(parser, html, stream)
+    return {'num_results': counts[0] if counts else None,
+            'articles': articles}
+
+def check(parser_class, html, expected=None):
+    """
+    Verifies that all engines yield the expected articles and result
+    count, whether parsing whole pages or incrementally, and that the
+    count-only parser reports the same number of results. Returns a
+    list of mismatches.
+    """
+    results = {}
+    for engine in get_engines(parser_class):
+        for stream in (False, True):
+            results[engine + ('+stream' if stream else '')] = \
+                get_output(parser_class, engine, html, stream)
+    reference = results[scholar.SoupKitchen.ENGINE_BS4]
+    mismatches = [engine for engine, result in results.items()
+                  if result != reference]
+    if scholar.ScholarCountParser().parse(html) != reference['num_results']:
+        mismatches.append('count')
+    if expected is None:
+        mismatches.append('no expected output')
+    elif reference != expected:
+        mismatches.append('expected output')
+    return mismatches
+
+def get_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+            stderr=subprocess.STDOUT).decode('ascii').strip()
+    except Exception:
+        return None
+
+def report(results, baseline=None):
+    fmt = '%-22s %-11s %8s %10s %10s %10s   %s'
+    print(fmt % ('fixture', 'eng', 'articles', 'pages/s', 'arts/s',
+                 'peak KiB', ' / '.join(['%s ms' % phase for phase in PHASES])))
+    for key in sorted(results):
+        res = results[key]
+        fixture, engine = key.split(':')
+        phases = ' / '.join(['%.3f' % res['phases_ms'][phase] for phase in PHASES])
+        peak = '%.0f' % (res['peak_memory'] / 1024.0) \
+            if res['peak_memory'] is not None else '-'
+        line = fmt % (fixture, engine, res['articles'],
+                      '%.1f' % res['pages_per_sec'],
+                      '%.1f' % res['articles_per_sec'], peak, phases)
+        if baseline is not None and key in baseline:
+            line += '   (%.2fx)' % (res['pages_per_sec'] /
+                                    baseline[key]['pages_per_sec'])
+        print(line)
+
+def main():
+    usage = """bench_parsers.py [options] [fixture ...]
+Benchmarks scholar.py's parsers. Without arguments, uses all fixtures in
+bench/fixtures."""
+
+    fmt = optparse.IndentedHelpFormatter(max_help_position=50, width=100)
+    parser = optparse.OptionParser(usage=usage, formatter=fmt)
+    parser.add_option('-t', '--min-time', type='float', default=1.0,
+                      help='Minimum seconds to run each benchmark (default: 1.0)')
+    parser.add_option('-r', '--min-rounds', type='int', default=5,
+                      help='Minimum number of parses per benchmark (default: 5)')
+    parser.add_option('--json', metavar='FILE', default=None,
+                      help='Write results as JSON to FILE')
+    parser.add_option('--compare', metavar='FILE', default=None,
+                      help='Report throughput relative to results in JSON FILE')
+    parser.add_option('--stream', action='store_true', default=False,
+                      help='Also benchmark incremental parsing of pages in chunks')
+    parser.add_option('--check', action='store_true', default=False,
+                      help='Only verify that all parsers yield the expected results')
+    parser.add_option('--update-expected', action='store_true', default=False,
+                      help='Only rewrite the expected results of the fixtures')
+    options, args = parser.parse_args()
+
+    fixtures = args or sorted(glob.glob(os.path.join(BENCH_DIR, 'fixtures', '*.html')))
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as hdl:
+            baseline = json.load(hdl)['results']
+
+    results = {}
+    failed = False
+    for path in fixtures:
+        name = os.path.splitext(os.path.basename(path))[0]
+        parser_class = PARSERS.get(name.split('-', 1)[0])
+        if parser_class is None:
+            print('skipping %s: no parser for its layout' % name)
+            continue
+        with open(path, 'rb') as hdl:
+            html = hdl.read()
+
+        expected_path = os.path.splitext(path)[0] + '.json'
+        if options.update_expected:
+            with open(expected_path, 'w') as hdl:
+                json.dump(get_output(parser_class, scholar.SoupKitchen.ENGINE_BS4, html),
+                          hdl, indent=2, sort_keys=True)
+                hdl.write('\n')
+            print('%-22s updated' % name)
+            continue
+
+        if options.check:
+            expected = None
+            if os.path.exists(expected_path):
+                with open(expected_path) as hdl:
+                    expected = json.load(hdl)
+            mismatches = check(parser_class, html, expected)
+            print('%-22s %s' % (name, 'MISMATCH: ' + ', '.join(mismatches)
+                                if mismatches else 'ok'))
+            failed = failed or len(mismatches) > 0
+            continue
+
+        for engine in get_engines(parser_class):
+            results['%s:%s' % (name, engine)] = bench(
+                parser_class, engine, html, options.min_time, options.min_rounds)
+            if options.stream:
+                results['%s:%s+stream' % (name, engine)] = bench(
+                    parser_class, engine, html, options.min_time,
+                    options.min_rounds, stream=True)
+
+    if options.check:
+        return 1 if failed else 0
+    if options.update_expected:
+        return 0
+
+    report(results, baseline)
+
+    if options.json:
+        with open(options.json, 'w') as hdl:
+            json.dump({'revision': get_revision(),
+                       'timestamp': time.time(),
+                       'python': platform.python_version(),
+                       'scholar': scholar.ScholarConf.VERSION,
+                       'results': results}, hdl, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
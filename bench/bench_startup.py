@@ -0,0 +1,179 @@
+#! /usr/bin/env python
+"""
+Benchmarks scholar.py's startup cost, i.e., what every command-line
+invocation pays before doing any actual work. For each scenario the
+benchmark runs scholar.py in a fresh interpreter with Python's
+"-X importtime" option (Python 3.7+) and reports the median wall-clock
+time of the invocation, the total time spent importing modules, and
+the top-level imports that cost the most.
+
+scholar.py defers importing modules that only some code paths need,
+such as BeautifulSoup, lxml, pyarrow, sqlite3 and the urllib stack.
+Use --check to verify that the scenarios below don't import them.
+
+Use --json to save results for later comparison via --compare, e.g.
+across commits.
+"""
+# Don't complain about missing docstrings: pylint: disable-msg=C0111
+
+import json
+import optparse
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHOLAR = os.path.join(os.path.dirname(BENCH_DIR), 'scholar.py')
+
+# Command-line arguments to scholar.py, by scenario name. None of these
+# touches the network.
+SCENARIOS = {
+    'version': ['--version'],
+    'help': ['--help'],
+}
+
+# Modules scholar.py should only import once they're actually needed:
+DEFERRED = ('bs4', 'BeautifulSoup', 'lxml', 'pyarrow', 'sqlite3', 'csv',
+            'urllib.request', 'urllib2', 'http.client', 'httplib',
+            'http.cookiejar', 'cookielib', 'email.utils',
+            'concurrent.futures')
+
+IMPORT_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$')
+
+
+def run(python, args):
+    """
+    Runs scholar.py once with the given arguments. Returns the wall
+    time in seconds and a list of (module, self usec, cumulative usec,
+    nesting level) tuples, in import order.
+    """
+    start = time.time()
+    proc = subprocess.Popen([python, '-X', 'importtime', SCHOLAR] + args,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    elapsed = time.time() - start
+
+    imports = []
+    for line in err.decode('utf-8', 'replace').splitlines():
+        match = IMPORT_RE.match(line)
+        if match is not None:
+            imports.append((match.group(4), int(match.group(1)),
+                            int(match.group(2)), len(match.group(3)) // 2))
+    return elapsed, imports
+
+def median(vals):
+    vals = sorted(vals)
+    mid = len(vals) // 2
+    if len(vals) % 2:
+        return vals[mid]
+    return (vals[mid - 1] + vals[mid]) / 2.0
+
+def bench(python, args, rounds, top):
+    walls, totals, cumulative = [], [], {}
+    modules = set()
+    for _ in range(rounds):
+        elapsed, imports = run(python, args)
+        walls.append(elapsed)
+        totals.append(sum(imp[1] for imp in imports) / 1000.0)
+        for name, _, cum, level in imports:
+            modules.add(name)
+            if level == 0:
+                cumulative.setdefault(name, []).append(cum / 1000.0)
+
+    heaviest = sorted(((median(vals), name) for name, vals in cumulative.items()),
+                      reverse=True)[:top]
+    return {'rounds': rounds,
+            'wall_ms': 1000 * median(walls),
+            'imports_ms': median(totals),
+            'modules': len(modules),
+            'deferred': sorted(mod for mod in DEFERRED if mod in modules),
+            'top': [[name, val] for val, name in heaviest]}
+
+def get_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+            stderr=subprocess.STDOUT).decode('ascii').strip()
+    except Exception:
+        return None
+
+def report(results, baseline=None):
+    fmt = '%-10s %10s %12s %8s   %s'
+    print(fmt % ('scenario', 'wall ms', 'imports ms', 'modules', 'top imports (cumulative ms)'))
+    for name in sorted(results):
+        res = results[name]
+        top = ', '.join(['%s %.1f' % (mod, val) for mod, val in res['top']])
+        line = fmt % (name, '%.1f' % res['wall_ms'], '%.1f' % res['imports_ms'],
+                      res['modules'], top)
+        if baseline is not None and name in baseline:
+            line += '   (%.2fx)' % (res['imports_ms'] / baseline[name]['imports_ms'])
+        print(line)
+
+def main():
+    usage = """bench_startup.py [options] [scenario ...]
+Benchmarks scholar.py's startup time. Scenarios: %s (default: all).""" \
+    % ', '.join(sorted(SCENARIOS))
+
+    fmt = optparse.IndentedHelpFormatter(max_help_position=50, width=100)
+    parser = optparse.OptionParser(usage=usage, formatter=fmt)
+    parser.add_option('-r', '--rounds', type='int', default=10,
+                      help='Number of invocations per scenario (default: 10)')
+    parser.add_option('--top', type='int', default=5,
+                      help='Number of most expensive imports to report (default: 5)')
+    parser.add_option('-p', '--python', metavar='PATH', default=sys.executable,
+                      help='Python interpreter to run scholar.py with (default: %s)'
+                      % sys.executable)
+    parser.add_option('--json', metavar='FILE', default=None,
+                      help='Write results as JSON to FILE')
+    parser.add_option('--compare', metavar='FILE', default=None,
+                      help='Report import time relative to results in JSON FILE')
+    parser.add_option('--check', action='store_true', default=False,
+                      help='Only verify that no scenario imports deferred modules')
+    options, args = parser.parse_args()
+
+    for name in args:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario "%s"' % name)
+
+    baseline = None
+    if options.compare:
+        with open(options.compare) as hdl:
+            baseline = json.load(hdl)['results']
+
+    results = {}
+    failed = False
+    for name in args or sorted(SCENARIOS):
+        if options.check:
+            _, imports = run(options.python, SCENARIOS[name])
+            if not imports:
+                print('%-10s no import timings, need Python 3.7+' % name)
+                failed = True
+                continue
+            loaded = set(imp[0] for imp in imports)
+            deferred = [mod for mod in DEFERRED if mod in loaded]
+            print('%-10s %s' % (name, 'IMPORTS: ' + ', '.join(deferred)
+                                if deferred else 'ok'))
+            failed = failed or len(deferred) > 0
+            continue
+
+        results[name] = bench(options.python, SCENARIOS[name],
+                              max(1, options.rounds), options.top)
+
+    if options.check:
+        return 1 if failed else 0
+
+    report(results, baseline)
+
+    if options.json:
+        with open(options.json, 'w') as hdl:
+            json.dump({'revision': get_revision(),
+                       'timestamp': time.time(),
+                       'python': platform.python_version(),
+                       'results': results}, hdl, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,30 @@
 #! /usr/bin/env python
 """
 This module provides classes for querying Google Scholar and parsing
-returned results. It currently *only* processes the first results
-page. It is not a recursive crawler.
+returned results. ScholarQuerier.iter_results() walks successive
+results pages of a query, ScholarQueryPlanner splits broad queries into
+year ranges, and ScholarCrawler follows citation links between articles.
 """
 # ChangeLog
 # ---------
 #
+# 2.12  Batch and long-running use. Highlights:
+#
+#       - Results pages walk via ScholarQuerier.iter_results(), and
+#         search() is re-entrant, returning per-call ScholarResult
+#         objects. scholar_async.py adds an asyncio-based querier.
+#       - Request pacing with back-off on throttling, pooled keep-alive
+#         connections, and coalescing of identical concurrent requests.
+#       - Response cache (--cache-dir), raw response archive (--archive,
+#         --reparse), and a deduplicating article store (--store).
+#       - New modes: --batch, --watch, --crawl, --plan and --count-only.
+#       - lxml parser engine (--parser-engine), incremental parsing as
+#         pages arrive, and parsing in worker processes
+#         (--parse-processes).
+#       - JSONL and columnar output (--jsonl, --columnar), and request
+#         and parsing metrics (--stats).
+#       - Parser and startup benchmarks in bench/, tests in tests/.
+#
 # 2.11  The Scholar site seems to have become more picky about the
 #       number of results requested. The default of 20 in scholar.py
 #       could cause HTTP 503 responses. scholar.py now doesn't request
@@ -161,34 +179,100 @@ page. It is not a recursive crawler.
 # IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 # POSSIBILITY OF SUCH DAMAGE.
 
+import codecs
+import copy
+import heapq
+import importlib
+import itertools
+import json
 import optparse
 import os
+import random
 import re
 import sys
+import threading
+import time
 import warnings
+import zlib
 
 try:
     # Try importing for Python 3
     # pylint: disable-msg=F0401
     # pylint: disable-msg=E0611
-    from urllib.request import HTTPCookieProcessor, Request, build_opener
-    from urllib.parse import quote, unquote
-    from http.cookiejar import MozillaCookieJar
+    from urllib.parse import quote, unquote, urlparse
+    import queue
 except ImportError:
     # Fallback for Python 2
-    from urllib2 import Request, build_opener, HTTPCookieProcessor
     from urllib import quote, unquote
-    from cookielib import MozillaCookieJar
+    from urlparse import urlparse
+    import Queue as queue
 
-# Import BeautifulSoup -- try 4 first, fall back to older
-try:
-    from bs4 import BeautifulSoup
-except ImportError:
-    try:
-        from BeautifulSoup import BeautifulSoup
-    except ImportError:
-        print('We need BeautifulSoup, sorry...')
-        sys.exit(1)
+
+class _LazyModule(object):
+    """
+    A stand-in for a module that gets imported only once one of its
+    attributes is first accessed. scholar.py relies on a number of
+    modules that are comparatively expensive to import, but that many
+    invocations (--help, --version, re-parsing archived pages, ...)
+    never need. The names are alternatives tried in order, e.g. the
+    Python 3 and Python 2 names of the same module.
+    """
+    def __init__(self, *names):
+        self._names = names
+        self._module = None
+
+    def is_available(self):
+        """Returns True if one of the module alternatives imports."""
+        try:
+            self._load()
+            return True
+        except ImportError:
+            return False
+
+    def _load(self):
+        if self._module is None:
+            for name in self._names[:-1]:
+                try:
+                    self._module = importlib.import_module(name)
+                    return self._module
+                except ImportError:
+                    pass
+            self._module = importlib.import_module(self._names[-1])
+        return self._module
+
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            # Don't import for special-method lookups, e.g. by copy.
+            raise AttributeError(attr)
+        return getattr(self._load(), attr)
+
+# pylint: disable-msg=C0103
+urllib_request = _LazyModule('urllib.request', 'urllib2')
+http_client = _LazyModule('http.client', 'httplib')
+cookiejar = _LazyModule('http.cookiejar', 'cookielib')
+email_utils = _LazyModule('email.utils', 'email.Utils')
+csvlib = _LazyModule('csv')
+gzip = _LazyModule('gzip')
+hashlib = _LazyModule('hashlib')
+sqlite3 = _LazyModule('sqlite3')
+html_lib = _LazyModule('html', 'HTMLParser') # See ScholarCountParser.
+
+# Process pools are available as of Python 3.2; without them, we
+# parse in-process.
+futures = _LazyModule('concurrent.futures')
+
+# BeautifulSoup -- we try 4 first, fall back to older. See
+# SoupKitchen.make_soup().
+bs4 = _LazyModule('bs4', 'BeautifulSoup')
+
+# lxml is optional: if present, it enables the faster "lxml" parser engine.
+lxml_html = _LazyModule('lxml.html')
+
+# pyarrow is optional: if present, it enables columnar output formats.
+pyarrow = _LazyModule('pyarrow')
+pyarrow_ipc = _LazyModule('pyarrow.ipc')
+pyarrow_parquet = _LazyModule('pyarrow.parquet')
+# pylint: enable-msg=C0103
 
 # Support unicode in both Python 2 and 3. In Python 3, unicode is str.
 if sys.version_info[0] == 3:
@@ -214,8 +298,55 @@ class QueryArgumentError(Error):
     """A query did not have a suitable set of arguments."""
 
 
+class ThrottledError(Error):
+    """
+    Scholar refused to serve a request because of our request rate,
+    either via an HTTP 429/503 response or by presenting a CAPTCHA.
+    """
+    def __init__(self, reason, retry_after=None):
+        Error.__init__(self, 'request throttled (%s)' % reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
 class SoupKitchen(object):
-    """Factory for creating BeautifulSoup instances."""
+    """
+    Factory for creating BeautifulSoup instances, and for the parse
+    trees of alternative parser engines.
+    """
+    ENGINE_BS4 = 'bs4'
+    ENGINE_LXML = 'lxml'
+    ENGINES = (ENGINE_BS4, ENGINE_LXML)
+
+    @staticmethod
+    def get_engine(engine=None):
+        """
+        Returns the name of the parser engine to use, given the
+        requested one (ScholarConf.PARSER_ENGINE by default). This falls
+        back to BeautifulSoup when the requested engine isn't available.
+        Resolve the engine once and configure the result, to avoid
+        repeated warnings about the fallback.
+        """
+        engine = engine or ScholarConf.PARSER_ENGINE
+        if engine == SoupKitchen.ENGINE_LXML and not lxml_html.is_available():
+            ScholarUtils.log('warn', 'lxml not available, parsing with BeautifulSoup')
+            return SoupKitchen.ENGINE_BS4
+        return engine
+
+    @staticmethod
+    def make_tree(markup):
+        """Factory method returning the root element of an lxml HTML
+        tree for the given markup, or None if the markup is empty.
+        """
+        if isinstance(markup, bytes):
+            try:
+                markup = markup.decode('utf-8')
+            except UnicodeDecodeError:
+                pass # Let lxml figure out the encoding.
+        try:
+            return lxml_html.document_fromstring(markup)
+        except Exception: # lxml.etree.ParserError for empty documents
+            return None
 
     @staticmethod
     def make_soup(markup, parser=None):
@@ -223,6 +354,10 @@ class SoupKitchen(object):
         instance will use a parser of the given name, if supported by
         the underlying BeautifulSoup instance.
         """
+        if not bs4.is_available():
+            print('We need BeautifulSoup, sorry...')
+            sys.exit(1)
+
         if 'bs4' in sys.modules:
             # We support parser specification. If the caller didn't
             # specify one, leave it to BeautifulSoup to pick the most
@@ -231,16 +366,22 @@ class SoupKitchen(object):
             # selects anyway.
             if parser is None:
                 warnings.filterwarnings('ignore', 'No parser was explicitly specified')
-            return BeautifulSoup(markup, parser)
+            return bs4.BeautifulSoup(markup, parser)
 
-        return BeautifulSoup(markup)
+        return bs4.BeautifulSoup(markup)
 
 class ScholarConf(object):
     """Helper class for global settings."""
 
-    VERSION = '2.10'
+    VERSION = '2.12'
     LOG_LEVEL = 1
     MAX_PAGE_RESULTS = 10 # Current default for per-page results
+
+    # The engine used for parsing results pages, one of the names in
+    # SoupKitchen.ENGINES. The "lxml" engine requires the lxml package
+    # and is currently supported only by ScholarArticleParser120726 and
+    # its derivatives; other parsers always use BeautifulSoup.
+    PARSER_ENGINE = 'bs4'
     SCHOLAR_SITE = 'http://scholar.google.com'
 
     # USER_AGENT = 'Mozilla/5.0 (X11; U; FreeBSD i386; en-US; rv:1.9.2.9) Gecko/20100913 Firefox/3.6.9'
@@ -251,6 +392,92 @@ class ScholarConf(object):
     # cookie use across sessions.
     COOKIE_JAR_FILE = None
 
+    # Citation export data gets retrieved for all articles on a results
+    # page in parallel, using up to this many worker threads, and with
+    # no more than CITATION_PER_HOST requests in flight to any one host.
+    CITATION_WORKERS = 4
+    CITATION_PER_HOST = 2
+
+    # All requests to Scholar pass through a scheduler that limits the
+    # rate of requests to REQUEST_RATE per second on average, with
+    # bursts of up to REQUEST_BURST requests. Throttled requests get
+    # retried up to REQUEST_RETRIES times, with jittered exponential
+    # backoff starting at BACKOFF_BASE seconds and capped at
+    # BACKOFF_MAX seconds, unless Scholar tells us how long to wait.
+    REQUEST_RATE = 2.0
+    REQUEST_BURST = 10
+    REQUEST_RETRIES = 3
+    BACKOFF_BASE = 5.0
+    BACKOFF_MAX = 300.0
+
+    # Output sinks buffer this many records before writing them out,
+    # unless writing to a terminal.
+    OUTPUT_FLUSH_EVERY = 100
+
+    # If set, HTTP responses get cached in this directory. Results
+    # pages and citation exports expire after the given number of
+    # seconds, and the least recently used entries get evicted once the
+    # cache grows beyond CACHE_MAX_BYTES.
+    CACHE_DIR = None
+    CACHE_TTL = 24 * 3600
+    CACHE_CITATION_TTL = 30 * 24 * 3600
+    CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+    # Columnar output gets written in batches of this many rows.
+    COLUMNAR_BATCH_ROWS = 10000
+
+    # Watch mode refreshes watched clusters until it has spent this many
+    # requests. Clusters most likely to have changed go first: each
+    # cluster's priority is its citation velocity, i.e. the average
+    # number of new citations per day, plus WATCH_MIN_VELOCITY, times
+    # the days since its last refresh.
+    WATCH_BUDGET = 100
+    WATCH_MIN_VELOCITY = 0.01
+
+    # The citation graph crawler expands at most CRAWL_MAX_NODES
+    # articles per run, using CRAWL_WORKERS queriers in parallel, and
+    # checkpoints its progress after every CRAWL_CHECKPOINT_EVERY
+    # expansions.
+    CRAWL_MAX_NODES = 100
+    CRAWL_WORKERS = 2
+    CRAWL_CHECKPOINT_EVERY = 10
+
+    # If positive, queriers parse results pages in a pool of this many
+    # worker processes, so concurrent queries don't contend for the
+    # interpreter while parsing, and retrieval of further pages and
+    # batch queries proceeds while pages parse.
+    PARSE_PROCESSES = 0
+
+    # Responses get read in chunks of READ_CHUNK_SIZE bytes. With
+    # PARSE_STREAMING, queriers parse results pages incrementally as
+    # the chunks arrive, unless parsing happens in worker processes.
+    READ_CHUNK_SIZE = 16384
+    PARSE_STREAMING = True
+
+    # The query planner splits search queries by year range until each
+    # slice reports at most PLAN_REACHABLE_RESULTS results, the number
+    # of results Scholar lets us page through per query. Open-ended
+    # ranges start at PLAN_FIRST_YEAR, and PLAN_WORKERS queriers
+    # retrieve the slices in parallel.
+    PLAN_REACHABLE_RESULTS = 1000
+    PLAN_FIRST_YEAR = 1900
+    PLAN_WORKERS = 2
+
+    # If set, raw HTTP responses get archived in this directory, so
+    # they can be parsed again later, see --reparse.
+    ARCHIVE_DIR = None
+
+    # If set, all articles seen get recorded in this SQLite database,
+    # which merges repeat sightings and retains citation exports.
+    STORE_FILE = None
+
+    # With HTTP_KEEPALIVE, requests reuse persistent connections, keeping
+    # up to HTTP_POOL_SIZE idle connections per host. HTTP_COMPRESSION
+    # asks servers for gzip- or deflate-compressed responses.
+    HTTP_KEEPALIVE = True
+    HTTP_POOL_SIZE = 4
+    HTTP_COMPRESSION = True
+
 class ScholarUtils(object):
     """A wrapper for various utensils that come in handy."""
 
@@ -267,11 +494,24 @@ class ScholarUtils(object):
             raise FormatError(msg)
 
     @staticmethod
-    def log(level, msg):
-        if level not in ScholarUtils.LOG_LEVELS.keys():
-            return
-        if ScholarUtils.LOG_LEVELS[level] > ScholarConf.LOG_LEVEL:
+    def log_enabled(level):
+        """
+        Predicate, checks whether messages of the given level get
+        logged. Use this to skip building expensive log messages.
+        """
+        return ScholarUtils.LOG_LEVELS.get(level, sys.maxsize) <= ScholarConf.LOG_LEVEL
+
+    @staticmethod
+    def log(level, msg, *args):
+        """
+        Logs the given message at the given level. Any further arguments
+        get interpolated into the message, but only if the message
+        actually gets logged.
+        """
+        if not ScholarUtils.log_enabled(level):
             return
+        if args:
+            msg = msg % args
         sys.stderr.write('[%5s]  %s' % (level.upper(), msg + '\n'))
         sys.stderr.flush()
 
@@ -280,73 +520,196 @@ class ScholarArticle(object):
     """
     A class representing articles listed on Google Scholar.  The class
     provides basic dictionary-like behavior.
+
+    To keep instances small, the standard attributes live in slots,
+    while their labels and order are kept once, at the class level.
+    Any other keys set via item assignment go into an overflow
+    dictionary that exists only when needed.
     """
+    # The standard attributes: (1) the key, (2) a user-suitable label
+    # for the item, and (3) the default value. The ordering index is
+    # the position in this list.
+    FIELDS = (
+        ('title',         'Title',          None),
+        ('url',           'URL',            None),
+        ('year',          'Year',           None),
+        ('num_citations', 'Citations',      0),
+        ('num_versions',  'Versions',       0),
+        ('cluster_id',    'Cluster ID',     None),
+        ('url_pdf',       'PDF link',       None),
+        ('url_citations', 'Citations list', None),
+        ('url_versions',  'Versions list',  None),
+        ('url_citation',  'Citation link',  None),
+        ('excerpt',       'Excerpt',        None),
+    )
+
+    KEYS = tuple([field[0] for field in FIELDS])
+    LABELS = dict([(field[0], field[1]) for field in FIELDS])
+    INDEXES = dict([(field[0], idx) for idx, field in enumerate(FIELDS)])
+
+    # Rendering the standard attributes in as_txt() needs this much
+    # room for the labels:
+    MAX_LABEL_LEN = max([len(field[1]) for field in FIELDS])
+
+    # The standard attributes holding integers in typed records, see
+    # as_record():
+    INT_KEYS = ('year', 'num_citations', 'num_versions')
+
+    # The overflow dictionary maps keys to [value, ordering index,
+    # insertion sequence]; deleted standard attributes are tracked in a
+    # set. Both are None while unused.
+    __slots__ = KEYS + ('citation_data', '_extra', '_deleted')
+
     def __init__(self):
-        # The triplets for each keyword correspond to (1) the actual
-        # value, (2) a user-suitable label for the item, and (3) an
-        # ordering index:
-        self.attrs = {
-            'title':         [None, 'Title',          0],
-            'url':           [None, 'URL',            1],
-            'year':          [None, 'Year',           2],
-            'num_citations': [0,    'Citations',      3],
-            'num_versions':  [0,    'Versions',       4],
-            'cluster_id':    [None, 'Cluster ID',     5],
-            'url_pdf':       [None, 'PDF link',       6],
-            'url_citations': [None, 'Citations list', 7],
-            'url_versions':  [None, 'Versions list',  8],
-            'url_citation':  [None, 'Citation link',  9],
-            'excerpt':       [None, 'Excerpt',       10],
-        }
+        for key, _, default in self.FIELDS:
+            setattr(self, key, default)
+        self._extra = None
+        self._deleted = None
 
         # The citation data in one of the standard export formats,
         # e.g. BibTeX.
         self.citation_data = None
 
     def __getitem__(self, key):
-        if key in self.attrs:
-            return self.attrs[key][0]
+        if self._is_field(key):
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key][0]
         return None
 
     def __len__(self):
-        return len(self.attrs)
+        return len(self.FIELDS) - len(self._deleted or ()) + len(self._extra or ())
 
     def __setitem__(self, key, item):
-        if key in self.attrs:
-            self.attrs[key][0] = item
+        if self._is_field(key):
+            setattr(self, key, item)
+        elif self._extra and key in self._extra:
+            self._extra[key][0] = item
         else:
-            self.attrs[key] = [item, key, len(self.attrs)]
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = [item, len(self), len(self.FIELDS) + len(self._extra)]
 
     def __delitem__(self, key):
-        if key in self.attrs:
-            del self.attrs[key]
+        if self._is_field(key):
+            if self._deleted is None:
+                self._deleted = set()
+            self._deleted.add(key)
+        elif self._extra and key in self._extra:
+            del self._extra[key]
+
+    def __getstate__(self):
+        return dict([(key, getattr(self, key)) for key in self.__slots__])
+
+    def __setstate__(self, state):
+        for key, val in state.items():
+            setattr(self, key, val)
+
+    def is_standard(self):
+        """
+        Predicate, checks whether the article has exactly the standard
+        attributes, i.e. none deleted and no others added.
+        """
+        return not self._deleted and not self._extra
+
+    def _is_field(self, key):
+        """
+        Predicate, checks whether the key refers to a standard attribute
+        that's in place. Once deleted, standard attributes behave like
+        any other key.
+        """
+        return key in self.INDEXES and \
+            not (self._deleted and key in self._deleted)
+
+    @property
+    def attrs(self):
+        """
+        The attributes in the (value, label, ordering index) triplet
+        form older versions of this class stored per instance. This is
+        a snapshot: modify the article via item assignment instead.
+        """
+        res = {}
+        if self.is_standard():
+            for idx, key in enumerate(self.KEYS):
+                res[key] = [getattr(self, key), self.LABELS[key], idx]
+            return res
+        for key, label, val in self.labeled_items():
+            if self._extra and key in self._extra:
+                res[key] = [val, label, self._extra[key][1]]
+            else:
+                res[key] = [val, label, self.INDEXES[key]]
+        return res
+
+    def labeled_items(self):
+        """
+        Returns a list of (key, label, value) tuples for all of the
+        article's attributes, in rendering order.
+        """
+        if self.is_standard():
+            # The common case: no sorting required.
+            return [(key, self.LABELS[key], getattr(self, key))
+                    for key in self.KEYS]
+
+        items = [((idx, idx), key, self.LABELS[key], getattr(self, key))
+                 for idx, key in enumerate(self.KEYS)
+                 if not self._deleted or key not in self._deleted]
+        for key, val in (self._extra or {}).items():
+            items.append(((val[1], val[2]), key, key, val[0]))
+        items.sort(key=lambda item: item[0])
+        return [item[1:] for item in items]
 
     def set_citation_data(self, citation_data):
         self.citation_data = citation_data
 
     def as_txt(self):
-        # Get items sorted in specified order:
-        items = sorted(list(self.attrs.values()), key=lambda item: item[2])
-        # Find largest label length:
-        max_label_len = max([len(str(item[1])) for item in items])
+        items = self.labeled_items()
+        if self.is_standard():
+            max_label_len = self.MAX_LABEL_LEN
+        else:
+            # Find largest label length:
+            max_label_len = max([len(str(item[1])) for item in items])
         fmt = '%%%ds %%s' % max_label_len
         res = []
-        for item in items:
-            if item[0] is not None:
-                res.append(fmt % (item[1], item[0]))
+        for _, label, val in items:
+            if val is not None:
+                res.append(fmt % (label, val))
         return '\n'.join(res)
 
     def as_csv(self, header=False, sep='|'):
-        # Get keys sorted in specified order:
-        keys = [pair[0] for pair in \
-                sorted([(key, val[2]) for key, val in list(self.attrs.items())],
-                       key=lambda pair: pair[1])]
+        items = self.labeled_items()
         res = []
         if header:
-            res.append(sep.join(keys))
-        res.append(sep.join([unicode(self.attrs[key][0]) for key in keys]))
+            res.append(sep.join([item[0] for item in items]))
+        res.append(sep.join([unicode(item[2]) for item in items]))
         return '\n'.join(res)
 
+    def as_dict(self):
+        """
+        Returns the article's attributes as a dictionary, plus any
+        retrieved citation data under the 'citation_data' key.
+        """
+        res = dict([(key, val) for key, _, val in self.labeled_items()])
+        if self.citation_data is not None:
+            data = self.citation_data
+            if isinstance(data, bytes):
+                data = data.decode('utf-8', 'replace')
+            res['citation_data'] = data
+        return res
+
+    def as_record(self):
+        """
+        Like as_dict(), but with typed values: the integer attributes
+        listed in INT_KEYS are ints, or None if unknown or malformed.
+        """
+        res = self.as_dict()
+        for key in self.INT_KEYS:
+            if key in res and res[key] is not None:
+                try:
+                    res[key] = int(res[key])
+                except (TypeError, ValueError):
+                    res[key] = None
+        return res
+
     def as_citation(self):
         """
         Reports the article in a standard citation format. This works only
@@ -362,12 +725,22 @@ class ScholarArticleParser(object):
     Google Scholar. This is a base class; concrete implementations
     adapting to tweaks made by Google over time follow below.
     """
-    def __init__(self, site=None):
+    # Whether the parser implements parsing via lxml parse trees, see
+    # _parse_tree().
+    SUPPORTS_LXML = False
+
+    def __init__(self, site=None, engine=None, max_articles=None):
         self.soup = None
         self.article = None
         self.site = site or ScholarConf.SCHOLAR_SITE
+        self.engine = engine
         self.year_re = re.compile(r'\b(?:20|19)\d{2}\b')
 
+        # If set, parsing stops once this many articles got handled:
+        self.max_articles = max_articles
+        self.num_articles = 0
+        self._splitter = None
+
     def handle_article(self, art):
         """
         The parser invokes this callback on each article parsed
@@ -387,6 +760,12 @@ class ScholarArticleParser(object):
         content as needed, and notifies the parser instance of
         resulting instances via the handle_article callback.
         """
+        if self._uses_lxml():
+            tree = SoupKitchen.make_tree(html)
+            if tree is not None:
+                self._parse_tree(tree)
+            return
+
         self.soup = SoupKitchen.make_soup(html)
 
         # This parses any global, non-itemized attributes from the page.
@@ -395,9 +774,68 @@ class ScholarArticleParser(object):
         # Now parse out listed articles:
         for div in self.soup.findAll(ScholarArticleParser._tag_results_checker):
             self._parse_article(div)
-            self._clean_article()
-            if self.article['title']:
-                self.handle_article(self.article)
+            if not self._handle_parsed_article():
+                break
+
+    def feed(self, data):
+        """
+        This method parses a results page incrementally, as the given
+        chunks of it arrive: the page gets split into the global
+        results header and the individual results (see
+        ScholarPageSplitter), each of which gets parsed as soon as it
+        is complete. Articles therefore reach handle_article() while
+        the rest of the page is still outstanding. Returns False once
+        parsing stopped because max_articles articles got handled, so
+        the rest of the page needn't be fed. The resulting articles are
+        identical to those of parse().
+        """
+        if self._splitter is None:
+            self._splitter = ScholarPageSplitter()
+            self._splitter.handle_header = self._parse_header_part
+            self._splitter.handle_result = self._parse_result_part
+        return self._splitter.feed(data)
+
+    def _uses_lxml(self):
+        return self.SUPPORTS_LXML and \
+            SoupKitchen.get_engine(self.engine) == SoupKitchen.ENGINE_LXML
+
+    def _parse_header_part(self, html):
+        """Helper for feed(), parses the global results header."""
+        if self._uses_lxml():
+            tree = SoupKitchen.make_tree(html)
+            if tree is not None:
+                self._parse_globals_tree(tree)
+        else:
+            self.soup = SoupKitchen.make_soup(html)
+            self._parse_globals()
+
+    def _parse_result_part(self, html):
+        """Helper for feed(), parses an individual result."""
+        div = None
+        if self._uses_lxml():
+            tree = SoupKitchen.make_tree(html)
+            if tree is not None:
+                div = next(tree.iter('div'), None)
+                if div is not None:
+                    self._parse_article_tree(div)
+        else:
+            self.soup = SoupKitchen.make_soup(html)
+            div = self.soup.find(ScholarArticleParser._tag_results_checker)
+            if div is not None:
+                self._parse_article(div)
+        if div is not None and not self._handle_parsed_article():
+            self._splitter.stop()
+
+    def _handle_parsed_article(self):
+        """
+        Helper, hands off the article just parsed if it has a title.
+        Returns False once max_articles articles got handled.
+        """
+        self._clean_article()
+        if self.article['title']:
+            self.handle_article(self.article)
+            self.num_articles += 1
+        return self.max_articles is None or self.num_articles < self.max_articles
 
     def _clean_article(self):
         """
@@ -408,27 +846,87 @@ class ScholarArticleParser(object):
         if self.article['title']:
             self.article['title'] = self.article['title'].strip()
 
+    def _parse_tree(self, root):
+        """
+        Counterpart to parse() for the lxml engine: parses the lxml
+        tree with the given root element. The resulting articles must
+        be identical to those parse() produces via BeautifulSoup.
+        """
+        self._parse_globals_tree(root)
+
+        for div in root.iter('div'):
+            if not self._el_has_class(div, 'gs_r'):
+                continue
+            self._parse_article_tree(div)
+            if not self._handle_parsed_article():
+                break
+
+    def _parse_globals_tree(self, root):
+        """Counterpart to _parse_globals() for the lxml engine."""
+        tag = root.find('.//div[@id="gs_ab_md"]')
+        if tag is not None:
+            texts = (text for text in self._el_strings(tag) if text.strip())
+            num_results = self._get_num_results(next(texts, None))
+            if num_results is not None:
+                self.handle_num_results(num_results)
+
+    def _parse_article_tree(self, div):
+        """
+        Counterpart to _parse_article() for the lxml engine. Derived
+        classes supporting that engine must implement it.
+        """
+        raise NotImplementedError()
+
+    def _parse_links_tree(self, span):
+        """Counterpart to _parse_links() for the lxml engine."""
+        for tag in span:
+            if tag.tag != 'a' or tag.get('href') is None:
+                continue
+            href = tag.get('href')
+
+            if href.startswith('/scholar?cites'):
+                string = self._el_string(tag)
+                if string is not None and string.startswith('Cited by'):
+                    self.article['num_citations'] = \
+                        self._as_int(string.split()[-1])
+
+                # See _parse_links() regarding the num argument and the
+                # cluster ID.
+                self.article['url_citations'] = \
+                    self._strip_url_arg('num', self._path2url(href))
+
+                args = self.article['url_citations'].split('?', 1)[1]
+                for arg in args.split('&'):
+                    if arg.startswith('cites='):
+                        self.article['cluster_id'] = arg[6:]
+
+            if href.startswith('/scholar?cluster'):
+                string = self._el_string(tag)
+                if string is not None and string.startswith('All '):
+                    self.article['num_versions'] = \
+                        self._as_int(string.split()[1])
+                self.article['url_versions'] = \
+                    self._strip_url_arg('num', self._path2url(href))
+
+            if tag.text_content().startswith('Import'):
+                self.article['url_citation'] = self._path2url(href)
+
     def _parse_globals(self):
         tag = self.soup.find(name='div', attrs={'id': 'gs_ab_md'})
         if tag is not None:
-            raw_text = tag.findAll(text=True)
-            # raw text is a list because the body contains <b> etc
-            if raw_text is not None and len(raw_text) > 0:
-                try:
-                    num_results = raw_text[0].split()[1]
-                    # num_results may now contain commas to separate
-                    # thousands, strip:
-                    num_results = num_results.replace(',', '')
-                    num_results = int(num_results)
+            # raw text is a list because the body contains <b> etc,
+            # and the number may sit in nested divs:
+            raw_text = [text for text in tag.findAll(text=True) if text.strip()]
+            if len(raw_text) > 0:
+                num_results = self._get_num_results(raw_text[0])
+                if num_results is not None:
                     self.handle_num_results(num_results)
-                except (IndexError, ValueError):
-                    pass
 
     def _parse_article(self, div):
         self.article = ScholarArticle()
 
         for tag in div:
-            if not hasattr(tag, 'name'):
+            if getattr(tag, 'name', None) is None:
                 continue
 
             if tag.name == 'div' and self._tag_has_class(tag, 'gs_rt') and \
@@ -440,7 +938,7 @@ class ScholarArticleParser(object):
 
             if tag.name == 'font':
                 for tag2 in tag:
-                    if not hasattr(tag2, 'name'):
+                    if getattr(tag2, 'name', None) is None:
                         continue
                     if tag2.name == 'span' and \
                        self._tag_has_class(tag2, 'gs_fl'):
@@ -448,7 +946,7 @@ class ScholarArticleParser(object):
 
     def _parse_links(self, span):
         for tag in span:
-            if not hasattr(tag, 'name'):
+            if getattr(tag, 'name', None) is None:
                 continue
             if tag.name != 'a' or tag.get('href') is None:
                 continue
@@ -492,12 +990,66 @@ class ScholarArticleParser(object):
         has a class attribute.
         """
         res = tag.get('class') or []
-        if type(res) != list:
+        if not isinstance(res, list):
             # BeautifulSoup 3 can return e.g. 'gs_md_wp gs_ttss',
             # so split -- conveniently produces a list in any case
             res = res.split()
         return klass in res
 
+    @staticmethod
+    def _el_has_class(elem, klass):
+        """
+        Like _tag_has_class(), but for elements of lxml trees.
+        """
+        return klass in (elem.get('class') or '').split()
+
+    @staticmethod
+    def _el_strings(elem, skip=None):
+        """
+        A generator yielding the non-empty text nodes in the subtree of
+        an lxml element, in document order, like BeautifulSoup's
+        findAll(text=True). This includes the content of comments. The
+        text inside elements of the tag name given via skip is omitted.
+        """
+        if elem.text:
+            yield elem.text
+        for child in elem:
+            if not isinstance(child.tag, str):
+                if child.text:
+                    yield child.text
+            elif child.tag != skip:
+                for text in ScholarArticleParser._el_strings(child, skip):
+                    yield text
+            if child.tail:
+                yield child.tail
+
+    @staticmethod
+    def _el_string(elem):
+        """
+        Returns the single string an lxml element contains, following
+        the semantics of BeautifulSoup's Tag.string: None if the element
+        has no content or more than one child node.
+        """
+        while True:
+            if len(elem) == 0:
+                return elem.text or None
+            if len(elem) > 1 or elem.text or elem[0].tail:
+                return None
+            elem = elem[0]
+
+    @staticmethod
+    def _get_num_results(text):
+        """
+        Returns the number of results reported by the given text, the
+        first string in the global results header, e.g. "About 12,300
+        results". Returns None if the text doesn't report a number.
+        """
+        try:
+            # The number may contain commas to separate thousands:
+            return int(text.split()[1].replace(',', ''))
+        except (AttributeError, IndexError, ValueError):
+            return None
+
     @staticmethod
     def _tag_results_checker(tag):
         return tag.name == 'div' \
@@ -539,7 +1091,7 @@ class ScholarArticleParser120201(ScholarArticleParser):
         self.article = ScholarArticle()
 
         for tag in div:
-            if not hasattr(tag, 'name'):
+            if getattr(tag, 'name', None) is None:
                 continue
 
             if tag.name == 'h3' and self._tag_has_class(tag, 'gs_rt') and tag.a:
@@ -561,11 +1113,13 @@ class ScholarArticleParser120726(ScholarArticleParser):
     This class reflects update to the Scholar results page layout that
     Google made 07/26/12.
     """
+    SUPPORTS_LXML = True
+
     def _parse_article(self, div):
         self.article = ScholarArticle()
 
         for tag in div:
-            if not hasattr(tag, 'name'):
+            if getattr(tag, 'name', None) is None:
                 continue
             if str(tag).lower().find('.pdf'):
                 if tag.find('div', {'class': 'gs_ttss'}):
@@ -621,6 +1175,232 @@ class ScholarArticleParser120726(ScholarArticleParser):
                         raw_text = raw_text.replace('\n', '')
                         self.article['excerpt'] = raw_text
 
+    def _parse_article_tree(self, div):
+        self.article = ScholarArticle()
+
+        for tag in div:
+            if not isinstance(tag.tag, str):
+                continue # Comments and processing instructions
+
+            # Locate the first occurrence of each element of interest
+            # in a single walk over the subtree.
+            found = {}
+            for elem in tag.iterdescendants('div', 'h3'):
+                if elem.tag == 'h3':
+                    found.setdefault('h3', elem)
+                    continue
+                for klass in (elem.get('class') or '').split():
+                    if klass in ('gs_ttss', 'gs_a', 'gs_fl', 'gs_rs'):
+                        found.setdefault(klass, elem)
+
+            if 'gs_ttss' in found:
+                self._parse_links_tree(found['gs_ttss'])
+
+            if tag.tag != 'div' or not self._el_has_class(tag, 'gs_ri'):
+                continue
+
+            # See _parse_article() for the two title formats.
+            h3 = found.get('h3')
+            atag = h3.find('.//a') if h3 is not None else None
+            if atag is not None and atag.get('href') is not None:
+                self.article['title'] = ''.join(self._el_strings(atag))
+                self.article['url'] = self._path2url(atag.get('href'))
+                if self.article['url'].endswith('.pdf'):
+                    self.article['url_pdf'] = self.article['url']
+            elif h3 is not None:
+                # Skip the text of any spans, e.g. [CITATION]:
+                self.article['title'] = ''.join(self._el_strings(h3, skip='span'))
+
+            if 'gs_a' in found:
+                year = self.year_re.findall(found['gs_a'].text_content())
+                self.article['year'] = year[0] if len(year) > 0 else None
+
+            if 'gs_fl' in found:
+                self._parse_links_tree(found['gs_fl'])
+
+            if 'gs_rs' in found:
+                raw_text = list(self._el_strings(found['gs_rs']))
+                if len(raw_text) > 0:
+                    raw_text = ''.join(raw_text)
+                    self.article['excerpt'] = raw_text.replace('\n', '')
+
+
+class ScholarPageSplitter(object):
+    """
+    Splits results pages incrementally into the parts the parsers
+    look at: the global results header (the div with ID "gs_ab_md")
+    and the individual results (divs with class "gs_r"). Feed it a page
+    in chunks of any size; as soon as a part is complete, it invokes
+    handle_header() or handle_result() with that part's HTML. Once
+    stop() got called, the remainder of the page is ignored.
+
+    The splitter only tracks the nesting of divs, skipping comments,
+    scripts and style sheets, so it is a lot cheaper than building a
+    parse tree of the whole page. The parts are the ones
+    ScholarArticleParser.parse() looks at, see its feed() method.
+    """
+    # The starts of the constructs we need to recognize:
+    START_RE = re.compile(r'<(?:(!--)|(script|style)\b|(/?)div\b)', re.I)
+    # The remainder of a tag, respecting quoted attribute values:
+    TAG_END_RE = re.compile(r'(?:[^>"\']|"[^"]*"|\'[^\']*\')*>')
+    ID_RE = re.compile(r'\sid\s*=\s*["\']?gs_ab_md["\'\s/>]', re.I)
+    CLASS_RE = re.compile(r'\sclass\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.I)
+
+    def __init__(self):
+        self.stopped = False
+        self._buf = ''
+        self._pos = 0 # Where to continue scanning the buffer
+        self._kind = None # The kind of part being collected, if any
+        self._start = 0 # The part's offset in the buffer
+        self._depth = 0 # The nesting depth of divs within the part
+        self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+
+    def handle_header(self, html):
+        """
+        The splitter invokes this callback with the HTML of the global
+        results header. The base class implementation does nothing.
+        """
+
+    def handle_result(self, html):
+        """
+        The splitter invokes this callback with the HTML of each
+        individual result. The base class implementation does nothing.
+        """
+
+    def feed(self, data):
+        """
+        Processes the given chunk of the page, as bytes or text.
+        Returns False once the splitter got stopped, True otherwise.
+        """
+        if self.stopped:
+            return False
+        if isinstance(data, bytes):
+            data = self._decoder.decode(data)
+        self._buf += data
+        self._scan()
+
+        # Drop what we no longer need, keeping the current part:
+        keep = self._start if self._kind is not None else self._pos
+        self._buf = self._buf[keep:]
+        self._pos -= keep
+        self._start -= keep
+        return not self.stopped
+
+    def stop(self):
+        """Stops splitting, ignoring any further input."""
+        self.stopped = True
+
+    def _scan(self):
+        buf = self._buf
+        while not self.stopped:
+            match = self.START_RE.search(buf, self._pos)
+            if match is None:
+                # A construct's start may be cut off at the chunk's end:
+                self._pos = max(self._pos, buf.rfind('<', len(buf) - 6), 0)
+                return
+
+            if match.group(1):
+                end = buf.find('-->', match.end())
+                if end < 0:
+                    self._pos = match.start()
+                    return
+                self._pos = end + 3
+                continue
+
+            if match.group(2):
+                end = re.compile(r'</%s\s*>' % match.group(2), re.I).search(buf, match.end())
+                if end is None:
+                    self._pos = match.start()
+                    return
+                self._pos = end.end()
+                continue
+
+            end = self.TAG_END_RE.match(buf, match.end())
+            if end is None:
+                self._pos = match.start()
+                return
+            self._pos = end.end()
+
+            if match.group(3):
+                self._handle_endtag()
+            else:
+                self._handle_starttag(match.start(), buf[match.start():end.end()])
+
+    def _handle_starttag(self, offset, tag):
+        if self._kind is None:
+            if self.ID_RE.search(tag):
+                self._kind = 'header'
+            else:
+                match = self.CLASS_RE.search(tag)
+                if match is None or 'gs_r' not in \
+                   (match.group(1) or match.group(2) or match.group(3)).split():
+                    return
+                self._kind = 'result'
+            self._start = offset
+        if not tag.endswith('/>'):
+            self._depth += 1
+        elif self._depth == 0:
+            self._kind = None # An empty part
+
+    def _handle_endtag(self):
+        if self._kind is None:
+            return
+        self._depth -= 1
+        if self._depth > 0:
+            return
+
+        kind, html = self._kind, self._buf[self._start:self._pos]
+        self._kind = None
+        if kind == 'header':
+            self.handle_header(html)
+        else:
+            self.handle_result(html)
+
+
+class ScholarCountParser(ScholarPageSplitter):
+    """
+    Parses results pages only as far as needed to determine the total
+    number of results Scholar reports, i.e., up to the end of the
+    global results header.
+    """
+    CHUNK_SIZE = 8192
+
+    TAG_RE = re.compile(r'<[^>]*>')
+
+    def __init__(self):
+        ScholarPageSplitter.__init__(self)
+        self.num_results = None
+
+    def parse(self, html):
+        """
+        Returns the number of results the given page reports, or None
+        if it doesn't report any.
+        """
+        for start in range(0, len(html), self.CHUNK_SIZE):
+            if not self.feed(html[start:start + self.CHUNK_SIZE]):
+                break
+        return self.num_results
+
+    def handle_header(self, html):
+        # As in _parse_globals(), the number is in the first string
+        # that isn't just whitespace, possibly within nested markup:
+        for text in self.TAG_RE.split(html):
+            if text.strip():
+                self.num_results = ScholarArticleParser._get_num_results(
+                    self._unescape(text))
+                break
+        self.stop()
+
+    @staticmethod
+    def _unescape(text):
+        """
+        Helper, decodes the HTML entities in the given text, e.g. the
+        "&nbsp;" Scholar may place between number and "results".
+        """
+        if hasattr(html_lib, 'unescape'):
+            return html_lib.unescape(text)
+        return html_lib.HTMLParser().unescape(text) # Python 2
+
 
 class ScholarQuery(object):
     """
@@ -634,6 +1414,10 @@ class ScholarQuery(object):
         # in attrs, see below).
         self.num_results = None
 
+        # The offset of the first result requested, for retrieval of
+        # results pages beyond the first one.
+        self.start = None
+
         # Queries may have global result attributes, similar to
         # per-article attributes in ScholarArticle. The exact set of
         # attributes may differ by query type, but they all share the
@@ -645,6 +1429,14 @@ class ScholarQuery(object):
             num_page_results,
             'maximum number of results on page must be numeric')
 
+    def set_start(self, start):
+        """
+        Sets the offset of the first result to request, i.e. the number
+        of results to skip.
+        """
+        self.start = ScholarUtils.ensure_int(
+            start, 'offset of first result must be numeric')
+
     def get_url(self):
         """
         Returns a complete, submittable URL string for this particular
@@ -676,6 +1468,17 @@ class ScholarQuery(object):
         if key in self.attrs:
             self.attrs[key][0] = item
 
+    def _get_paging_args(self):
+        """
+        Helper, returns the URL arguments for the number of results
+        requested and the offset of the first result. These must not be
+        quoted, or the server will not recognize them.
+        """
+        return {'num': ('&num=%d' % self.num_results
+                        if self.num_results is not None else ''),
+                'start': ('&start=%d' % self.start
+                          if self.start else '')}
+
     def _parenthesize_phrases(self, query):
         """
         Turns a query string containing comma-separated phrases into a
@@ -708,7 +1511,8 @@ class ClusterScholarQuery(ScholarQuery):
     """
     SCHOLAR_CLUSTER_URL = ScholarConf.SCHOLAR_SITE + '/scholar?' \
         + 'cluster=%(cluster)s' \
-        + '%(num)s'
+        + '%(num)s' \
+        + '%(start)s'
 
     def __init__(self, cluster=None):
         ScholarQuery.__init__(self)
@@ -732,14 +1536,44 @@ class ClusterScholarQuery(ScholarQuery):
         for key, val in urlargs.items():
             urlargs[key] = quote(encode(val))
 
-        # The following URL arguments must not be quoted, or the
-        # server will not recognize them:
-        urlargs['num'] = ('&num=%d' % self.num_results
-                          if self.num_results is not None else '')
+        urlargs.update(self._get_paging_args())
 
         return self.SCHOLAR_CLUSTER_URL % urlargs
 
 
+class CitationsScholarQuery(ScholarQuery):
+    """
+    This version pulls up the articles citing the article cluster with
+    the given ID, i.e., the "Cited by" list.
+    """
+    SCHOLAR_CITATIONS_URL = ScholarConf.SCHOLAR_SITE + '/scholar?' \
+        + 'cites=%(cluster)s' \
+        + '%(num)s' \
+        + '%(start)s'
+
+    def __init__(self, cluster=None):
+        ScholarQuery.__init__(self)
+        self._add_attribute_type('num_results', 'Results', 0)
+        self.cluster = None
+        self.set_cluster(cluster)
+
+    def set_cluster(self, cluster):
+        """
+        Sets search to the citations of a Google Scholar results cluster.
+        """
+        msg = 'cluster ID must be numeric'
+        self.cluster = ScholarUtils.ensure_int(cluster, msg)
+
+    def get_url(self):
+        if self.cluster is None:
+            raise QueryArgumentError('citations query needs cluster ID')
+
+        urlargs = {'cluster': quote(encode(self.cluster))}
+        urlargs.update(self._get_paging_args())
+
+        return self.SCHOLAR_CITATIONS_URL % urlargs
+
+
 class SearchScholarQuery(ScholarQuery):
     """
     This version represents the search query parameters the user can
@@ -758,6 +1592,7 @@ class SearchScholarQuery(ScholarQuery):
         + '&as_vis=%(citations)s' \
         + '&btnG=&hl=en' \
         + '%(num)s' \
+        + '%(start)s' \
         + '&as_sdt=%(patents)s%%2C5'
 
     def __init__(self):
@@ -857,14 +1692,39 @@ class SearchScholarQuery(ScholarQuery):
         for key, val in urlargs.items():
             urlargs[key] = quote(encode(val))
 
-        # The following URL arguments must not be quoted, or the
-        # server will not recognize them:
-        urlargs['num'] = ('&num=%d' % self.num_results
-                          if self.num_results is not None else '')
+        urlargs.update(self._get_paging_args())
 
         return self.SCHOLAR_QUERY_URL % urlargs
 
 
+class ScholarResult(object):
+    """
+    The outcome of a single query sent via ScholarQuerier.search():
+    the ScholarArticle instances found, in the articles member, and the
+    global result attributes Scholar reported, such as the total number
+    of results. The latter live in the result's own copy of the query,
+    and are accessible via the [] operator, e.g. result['num_results'].
+    The retrieved member indicates whether the results page got
+    retrieved at all.
+    """
+    def __init__(self, query):
+        self.query = copy.deepcopy(query)
+        self.articles = []
+        self.retrieved = False
+
+    def __getitem__(self, key):
+        return self.query[key]
+
+    def __setitem__(self, key, item):
+        self.query[key] = item
+
+    def __len__(self):
+        return len(self.articles)
+
+    def __iter__(self):
+        return iter(self.articles)
+
+
 class ScholarSettings(object):
     """
     This class lets you adjust the Scholar settings for your
@@ -900,83 +1760,1615 @@ class ScholarSettings(object):
     def is_configured(self):
         return self._is_configured
 
+    def get_fingerprint(self):
+        """
+        Returns a string identifying the preferences these settings
+        establish at the configured Scholar site.
+        """
+        return 'site=%s&citform=%s&num=%s' % (ScholarConf.SCHOLAR_SITE,
+                                              self.citform,
+                                              self.per_page_results)
+
 
-class ScholarQuerier(object):
+class ScholarMetrics(object):
     """
-    ScholarQuerier instances can conduct a search on Google Scholar
-    with subsequent parsing of the resulting HTML content.  The
-    articles found are collected in the articles member, a list of
-    ScholarArticle instances.
+    A thread-safe collection of named counters and histograms, for
+    reporting what a querier spent its time and requests on. Metrics
+    spring into existence when first updated. Histograms count
+    observations into the buckets configured in BUCKETS, Prometheus
+    style, and track their sum, minimum and maximum.
     """
+    # Upper bounds of the histogram buckets, per histogram:
+    BUCKETS = {
+        'request_seconds': (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+        'parse_seconds': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+        'response_bytes': (10000, 50000, 100000, 250000, 500000, 1000000),
+        'page_articles': (0, 1, 5, 10, 20),
+    }
+    DEFAULT_BUCKETS = (0.01, 0.1, 1, 10, 100)
 
-    # Default URLs for visiting and submitting Settings pane, as of 3/14
-    GET_SETTINGS_URL = ScholarConf.SCHOLAR_SITE + '/scholar_settings?' \
-        + 'sciifh=1&hl=en&as_sdt=0,5'
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        """Adds the given value to the named counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name, value):
+        """Sets the named counter to the given value."""
+        with self._lock:
+            self._counters[name] = value
+
+    def observe(self, name, value):
+        """Records an observation of the given value in the named histogram."""
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                bounds = self.BUCKETS.get(name, self.DEFAULT_BUCKETS)
+                hist = {'bounds': bounds, 'buckets': [0] * (len(bounds) + 1),
+                        'count': 0, 'sum': 0, 'min': value, 'max': value}
+                self._histograms[name] = hist
+            idx = 0
+            while idx < len(hist['bounds']) and value > hist['bounds'][idx]:
+                idx += 1
+            hist['buckets'][idx] += 1
+            hist['count'] += 1
+            hist['sum'] += value
+            hist['min'] = min(hist['min'], value)
+            hist['max'] = max(hist['max'], value)
+
+    def as_dict(self):
+        """
+        Returns a snapshot of all metrics, as a dictionary with
+        'counters' and 'histograms' keys. Histogram bucket counts are
+        cumulative, keyed by their upper bounds.
+        """
+        with self._lock:
+            hists = {}
+            for name, hist in self._histograms.items():
+                total, buckets = 0, []
+                for bound, num in zip(list(hist['bounds']) + ['+Inf'], hist['buckets']):
+                    total += num
+                    buckets.append([bound, total])
+                hists[name] = {'count': hist['count'], 'sum': hist['sum'],
+                               'min': hist['min'], 'max': hist['max'],
+                               'buckets': buckets}
+            return {'counters': dict(self._counters), 'histograms': hists}
+
+    def as_prometheus(self, prefix='scholar_'):
+        """Returns all metrics in the Prometheus text exposition format."""
+        snap = self.as_dict()
+        res = []
+        for name, val in sorted(snap['counters'].items()):
+            res.append('# TYPE %s%s_total counter' % (prefix, name))
+            res.append('%s%s_total %s' % (prefix, name, val))
+        for name, hist in sorted(snap['histograms'].items()):
+            res.append('# TYPE %s%s histogram' % (prefix, name))
+            for bound, num in hist['buckets']:
+                res.append('%s%s_bucket{le="%s"} %d' % (prefix, name, bound, num))
+            res.append('%s%s_sum %s' % (prefix, name, hist['sum']))
+            res.append('%s%s_count %d' % (prefix, name, hist['count']))
+        return '\n'.join(res) + '\n'
 
-    SET_SETTINGS_URL = ScholarConf.SCHOLAR_SITE + '/scholar_setprefs?' \
-        + 'q=' \
-        + '&scisig=%(scisig)s' \
-        + '&inststart=0' \
-        + '&as_sdt=1,5' \
-        + '&as_sdtp=' \
-        + '&num=%(num)s' \
-        + '&scis=%(scis)s' \
-        + '%(scisf)s' \
-        + '&hl=en&lang=all&instq=&inst=569367360547434339&save='
+    def as_txt(self):
+        """Returns a human-readable summary of all metrics."""
+        snap = self.as_dict()
+        names = list(snap['counters']) + list(snap['histograms'])
+        width = max([len(name) for name in names] + [0])
+        res = []
+        for name, val in sorted(snap['counters'].items()):
+            res.append('%*s %s' % (width, name, val if isinstance(val, int)
+                                   else '%.3f' % val))
+        for name, hist in sorted(snap['histograms'].items()):
+            res.append('%*s n=%d mean=%.3f min=%.3f max=%.3f'
+                       % (width, name, hist['count'], hist['sum'] / float(hist['count']),
+                          hist['min'], hist['max']))
+        return '\n'.join(res)
 
-    # Older URLs:
-    # ScholarConf.SCHOLAR_SITE + '/scholar?q=%s&hl=en&btnG=Search&as_sdt=2001&as_sdtp=on
+    def save(self, path):
+        """
+        Writes all metrics to the given file, as JSON if its name ends
+        in .json, in the Prometheus text format otherwise.
+        """
+        with open(path, 'w') as hdl:
+            if path.lower().endswith('.json'):
+                json.dump(self.as_dict(), hdl, indent=2, sort_keys=True)
+            else:
+                hdl.write(self.as_prometheus())
 
-    class Parser(ScholarArticleParser120726):
-        def __init__(self, querier):
-            ScholarArticleParser120726.__init__(self)
+
+class ScholarRequestScheduler(object):
+    """
+    Paces outgoing requests using a token bucket, and backs off when
+    Scholar throttles us. While backing off, no request from any thread
+    sharing the scheduler proceeds. The scheduler keeps counters of
+    its activity, available via get_counters().
+    """
+    def __init__(self, rate=None, burst=None, retries=None,
+                 backoff_base=None, backoff_max=None):
+        self.rate = ScholarConf.REQUEST_RATE if rate is None else rate
+        self.burst = max(1, ScholarConf.REQUEST_BURST if burst is None else burst)
+        self.retries = ScholarConf.REQUEST_RETRIES if retries is None else retries
+        self.backoff_base = ScholarConf.BACKOFF_BASE \
+            if backoff_base is None else backoff_base
+        self.backoff_max = ScholarConf.BACKOFF_MAX \
+            if backoff_max is None else backoff_max
+
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._last = time.time()
+        self._paused_until = 0
+        self._counters = {'requests': 0, 'retries': 0, 'throttled': 0,
+                          'failures': 0, 'waited': 0.0}
+
+    def call(self, attempt):
+        """
+        Invokes the given callable, once a request may be sent, and
+        returns its result. If it raises ThrottledError, the call gets
+        retried after backing off, as configured. Other exceptions
+        propagate unchanged.
+        """
+        tries = 0
+        while True:
+            delay = self.reserve()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                return attempt()
+            except ThrottledError as err:
+                delay = self.backoff(err, tries)
+                if delay is None:
+                    raise
+                tries += 1
+
+    def reserve(self):
+        """
+        Reserves a request slot and returns the number of seconds the
+        caller needs to wait before sending its request.
+        """
+        with self._lock:
+            now = time.time()
+            if self.rate > 0:
+                self._tokens = min(self.burst,
+                                   self._tokens + (now - self._last) * self.rate)
+            else:
+                self._tokens = self.burst
+            self._last = now
+            self._tokens -= 1
+
+            delay = max(0, self._paused_until - now)
+            if self._tokens < 0 and self.rate > 0:
+                delay = max(delay, -self._tokens / self.rate)
+
+            self._counters['requests'] += 1
+            self._counters['waited'] += delay
+            return delay
+
+    def backoff(self, err, tries):
+        """
+        Registers a throttled request (a ThrottledError) after the given
+        number of previous tries. Returns the number of seconds after
+        which to retry, or None if we should give up. All requests get
+        paused for that period.
+        """
+        with self._lock:
+            self._counters['throttled'] += 1
+            if tries >= self.retries:
+                self._counters['failures'] += 1
+                ScholarUtils.log('warn', 'giving up after %d retries: %s', tries, err)
+                return None
+
+            if err.retry_after is not None:
+                delay = err.retry_after
+            else:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** tries)
+                delay *= random.uniform(0.5, 1.0)
+
+            self._paused_until = max(self._paused_until, time.time() + delay)
+            self._counters['retries'] += 1
+            ScholarUtils.log('warn', '%s, retrying in %.1f seconds', err, delay)
+            return delay
+
+    def get_counters(self):
+        """Returns a dictionary of the scheduler's activity counters."""
+        with self._lock:
+            return dict(self._counters)
+
+    @staticmethod
+    def parse_retry_after(value):
+        """
+        Helper, converts a Retry-After header value, either in seconds
+        or as an HTTP date, into a number of seconds. Returns None if
+        the value is missing or unparseable.
+        """
+        if not value:
+            return None
+        try:
+            return max(0, int(value))
+        except ValueError:
+            pass
+        date = email_utils.parsedate_tz(value)
+        if date is None:
+            return None
+        return max(0, email_utils.mktime_tz(date) - time.time())
+
+
+class ScholarCache(object):
+    """
+    A persistent cache of HTTP response payloads, stored in a single
+    SQLite database. Entries are keyed by URL and come in three kinds:
+    results pages and citation exports, each with its own time-to-live,
+    and result counts of queries (see ScholarQuerier.get_num_results()),
+    which share the time-to-live of results pages. The store is bounded
+    in size by evicting least recently used entries. Instances can be
+    shared across threads.
+    """
+    KIND_RESULTS = 'results'
+    KIND_CITATION = 'citation'
+    KIND_COUNT = 'count'
+
+    DB_FILE = 'scholar-cache.sqlite'
+
+    def __init__(self, cache_dir, ttl=None, citation_ttl=None, max_bytes=None):
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        self.ttls = {
+            self.KIND_RESULTS: ScholarConf.CACHE_TTL if ttl is None else ttl,
+            self.KIND_COUNT: ScholarConf.CACHE_TTL if ttl is None else ttl,
+            self.KIND_CITATION: (ScholarConf.CACHE_CITATION_TTL
+                                 if citation_ttl is None else citation_ttl),
+        }
+        self.max_bytes = ScholarConf.CACHE_MAX_BYTES \
+            if max_bytes is None else max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(cache_dir, self.DB_FILE),
+                                   check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                         'key TEXT PRIMARY KEY, kind TEXT, data BLOB, '
+                         'size INTEGER, stored REAL, accessed REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed '
+                         'ON responses (accessed)')
+        self._db.commit()
+
+    def get(self, key, kind):
+        """
+        Returns the cached payload for the given key, or None if we
+        have no fresh entry of the given kind.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute('SELECT data, stored FROM responses '
+                                   'WHERE key = ? AND kind = ?',
+                                   (key, kind)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttls.get(kind, 0):
+                self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._db.commit()
+                return None
+            self._db.execute('UPDATE responses SET accessed = ? WHERE key = ?',
+                             (now, key))
+            self._db.commit()
+            return bytes(row[0])
+
+    def put(self, key, kind, data):
+        """Stores the given payload, evicting old entries as needed."""
+        now = time.time()
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO responses '
+                             '(key, kind, data, size, stored, accessed) '
+                             'VALUES (?, ?, ?, ?, ?, ?)',
+                             (key, kind, sqlite3.Binary(data), len(data), now, now))
+            self._evict()
+            self._db.commit()
+
+    def clear(self):
+        """Removes all cached entries."""
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _evict(self):
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) '
+                                 'FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute('SELECT key, size FROM responses '
+                                'ORDER BY accessed').fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+
+
+class ScholarArticleStore(object):
+    """
+    A persistent store of all articles seen across queries, kept in a
+    single SQLite database. Repeat sightings of an article merge into
+    one record, identified by the article's cluster ID or, for entries
+    without one such as [CITATION] results, by its normalized title and
+    year. A record keeps the highest citation count seen, and the
+    article's citation export once retrieved, so it needn't be fetched
+    again. Instances can be shared across threads.
+    """
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS articles ('
+                         'key TEXT PRIMARY KEY, attrs TEXT, '
+                         'num_citations INTEGER, citation_data BLOB, '
+                         'citation_format INTEGER, sightings INTEGER, '
+                         'first_seen REAL, last_seen REAL)')
+        self._db.commit()
+
+    @staticmethod
+    def get_key(art):
+        """
+        Returns the key identifying the given article in the store, or
+        None if the article has neither cluster ID nor title.
+        """
+        if art['cluster_id']:
+            return 'cluster:%s' % art['cluster_id']
+        return ScholarArticleStore._get_title_key(art)
+
+    @staticmethod
+    def _get_title_key(art):
+        if not art['title']:
+            return None
+        words = re.findall(r'\w+', unicode(art['title']).lower(), re.UNICODE)
+        return 'title:%s|%s' % (' '.join(words), art['year'] or '')
+
+    def add(self, art):
+        """
+        Records a sighting of the given article, merging it with any
+        previous ones. Returns the article's key, or None if the
+        article can't be identified.
+        """
+        key = self.get_key(art)
+        if key is None:
+            return None
+
+        attrs = art.as_dict()
+        attrs.pop('citation_data', None)
+        now = time.time()
+
+        with self._lock:
+            rows = [self._get_row(key)]
+            # An article we first saw without cluster ID may since have
+            # gained one; fold the earlier record into this one.
+            title_key = self._get_title_key(art)
+            if title_key is not None and title_key != key:
+                rows.append(self._get_row(title_key))
+                if rows[-1] is not None:
+                    self._db.execute('DELETE FROM articles WHERE key = ?',
+                                     (title_key,))
+
+            merged = {}
+            num_citations = attrs.get('num_citations') or 0
+            citation_data, citation_format = None, None
+            sightings, first_seen = 1, now
+            for row in reversed([row for row in rows if row is not None]):
+                merged.update(json.loads(row[0]))
+                num_citations = max(num_citations, row[1] or 0)
+                if row[2] is not None:
+                    citation_data, citation_format = row[2], row[3]
+                sightings += row[4]
+                first_seen = min(first_seen, row[5])
+
+            merged.update([(k, v) for k, v in attrs.items() if v is not None])
+            merged['num_citations'] = num_citations
+            if art.citation_data is not None:
+                citation_data, citation_format = art.citation_data, None
+
+            self._db.execute('INSERT OR REPLACE INTO articles '
+                             '(key, attrs, num_citations, citation_data, '
+                             'citation_format, sightings, first_seen, last_seen) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                             (key, json.dumps(merged), num_citations,
+                              self._as_blob(citation_data), citation_format,
+                              sightings, first_seen, now))
+            self._db.commit()
+        return key
+
+    def get(self, key):
+        """
+        Returns the stored article for the given key as a
+        ScholarArticle instance, or None if we have no such article.
+        """
+        with self._lock:
+            row = self._get_row(key)
+        if row is None:
+            return None
+        art = ScholarArticle()
+        for attr, val in json.loads(row[0]).items():
+            art[attr] = val
+        if row[2] is not None:
+            art.set_citation_data(bytes(row[2]))
+        return art
+
+    def get_citation_data(self, art, citation_format=None):
+        """
+        Returns the stored citation export for the given article, or
+        None if we have none. If a citation format is given (see
+        ScholarSettings), exports in other formats don't count.
+        """
+        key = self.get_key(art)
+        if key is None:
+            return None
+        with self._lock:
+            row = self._get_row(key)
+        if row is None or row[2] is None:
+            return None
+        if citation_format is not None and row[3] is not None \
+           and row[3] != citation_format:
+            return None
+        return bytes(row[2])
+
+    def set_citation_data(self, art, data, citation_format=None):
+        """
+        Stores a citation export for the given article, which must
+        have been added previously.
+        """
+        key = self.get_key(art)
+        if key is None:
+            return
+        with self._lock:
+            self._db.execute('UPDATE articles SET citation_data = ?, '
+                             'citation_format = ? WHERE key = ?',
+                             (self._as_blob(data), citation_format, key))
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM articles').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _get_row(self, key):
+        return self._db.execute('SELECT attrs, num_citations, citation_data, '
+                                'citation_format, sightings, first_seen '
+                                'FROM articles WHERE key = ?', (key,)).fetchone()
+
+    @staticmethod
+    def _as_blob(data):
+        if data is None:
+            return None
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        return sqlite3.Binary(data)
+
+
+class ScholarArchive(object):
+    """
+    An archive of raw HTTP responses, for parsing them again later,
+    e.g. with a new parser class after Scholar changed its markup.
+    Response bodies get stored gzip-compressed in files named by the
+    SHA-256 digest of their content, so identical responses get stored
+    only once. A SQLite index records every response by URL, kind (see
+    ScholarCache) and time of retrieval. Instances can be shared across
+    threads.
+    """
+    DB_FILE = 'index.sqlite'
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        if not os.path.isdir(archive_dir):
+            os.makedirs(archive_dir)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(archive_dir, self.DB_FILE),
+                                   check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                         'url TEXT, kind TEXT, fetched REAL, digest TEXT)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_url '
+                         'ON responses (url, fetched)')
+        self._db.commit()
+
+    def get_path(self, digest):
+        """Returns the name of the file holding the given response."""
+        return os.path.join(self.archive_dir, digest[:2], digest + '.gz')
+
+    def put(self, url, data, kind=None):
+        """
+        Archives the given response payload, retrieved from the given
+        URL. Returns the payload's digest.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.get_path(digest)
+        if not os.path.exists(path):
+            if not os.path.isdir(os.path.dirname(path)):
+                try:
+                    os.makedirs(os.path.dirname(path))
+                except OSError:
+                    pass # Another thread beat us to it.
+            tmp = '%s.%d.%d.tmp' % (path, os.getpid(), threading.current_thread().ident)
+            with gzip.open(tmp, 'wb') as hdl:
+                hdl.write(data)
+            getattr(os, 'replace', os.rename)(tmp, path)
+
+        with self._lock:
+            self._db.execute('INSERT INTO responses (url, kind, fetched, digest) '
+                             'VALUES (?, ?, ?, ?)', (url, kind, time.time(), digest))
+            self._db.commit()
+        return digest
+
+    def get(self, digest):
+        """Returns the archived payload with the given digest."""
+        with gzip.open(self.get_path(digest), 'rb') as hdl:
+            return hdl.read()
+
+    def get_entries(self, kind=None):
+        """
+        Returns a list of (url, kind, time of retrieval, digest) tuples
+        for the archived responses of the given kind, or of all kinds,
+        in order of retrieval.
+        """
+        with self._lock:
+            if kind is None:
+                return self._db.execute('SELECT url, kind, fetched, digest '
+                                        'FROM responses ORDER BY fetched').fetchall()
+            return self._db.execute('SELECT url, kind, fetched, digest '
+                                    'FROM responses WHERE kind = ? '
+                                    'ORDER BY fetched', (kind,)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ScholarParserPool(object):
+    """
+    A pipeline stage parsing results pages in a pool of worker
+    processes. Workers run the parser class of the given name and
+    record its callbacks; the parent process then replays them on a
+    local parser instance, in the order the worker invoked them. The
+    articles cross process boundaries as pickled ScholarArticle
+    instances, which are compact thanks to their slots. Instances can
+    be shared across threads, allowing as many pages to be parsed at
+    once as there are processes.
+    """
+    EVENT_NUM_RESULTS = 'num_results'
+    EVENT_ARTICLE = 'article'
+
+    def __init__(self, parser_name, processes=None, engine=None):
+        get_parser_class(parser_name) # Fail early on unknown parsers.
+        self.parser_name = parser_name
+        self.engine = engine or ScholarConf.PARSER_ENGINE
+        self._pool = futures.ProcessPoolExecutor(max_workers=processes or None)
+
+    def submit(self, html):
+        """
+        Schedules parsing of the given page and returns a future whose
+        result is the list of callback events, see replay().
+        """
+        return self._pool.submit(_parse_page, (html, self.parser_name, self.engine))
+
+    def parse(self, html, parser):
+        """
+        Parses the given page in a worker process and replays the
+        resulting callbacks on the given parser instance.
+        """
+        self.replay(self.submit(html).result(), parser)
+
+    @classmethod
+    def replay(cls, events, parser):
+        """
+        Invokes the given parser's callbacks as recorded in a list of
+        (event, value) tuples.
+        """
+        for event, value in events:
+            if event == cls.EVENT_ARTICLE:
+                parser.handle_article(value)
+            elif event == cls.EVENT_NUM_RESULTS:
+                parser.handle_num_results(value)
+
+    def close(self):
+        self._pool.shutdown()
+
+
+class ScholarSingleFlight(object):
+    """
+    Coalesces concurrent calls for the same key: while a call for a
+    key is in flight, further calls for that key wait for it and share
+    its outcome, i.e., its return value or the exception it raised,
+    rather than making calls of their own. Instances are thread-safe,
+    and can be shared by several queriers.
+    """
+    class Flight(object):
+        """The state of a call in flight."""
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def call(self, key, func):
+        """
+        Returns a tuple of func()'s return value and a flag indicating
+        whether that value is shared, i.e., got returned by a call
+        another thread made for the same key. Exceptions raised by the
+        call propagate to all threads sharing it.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = self.Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = func()
+        except BaseException as err:
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result, False
+
+    def __len__(self):
+        """Returns the number of calls in flight."""
+        with self._lock:
+            return len(self._flights)
+
+
+class ScholarCitationFetcher(object):
+    """
+    Retrieves citation export data for a list of articles using a
+    bounded pool of worker threads. At most `per_host` requests run
+    concurrently against any given host, to stay polite. The articles
+    are updated in place, so their order is unaffected.
+    """
+    def __init__(self, querier, workers=None, per_host=None):
+        self.querier = querier
+        self.workers = max(1, workers or ScholarConf.CITATION_WORKERS)
+        self.per_host = max(1, per_host or ScholarConf.CITATION_PER_HOST)
+        self._host_slots = {}
+        self._host_lock = threading.Lock()
+
+    def fetch(self, articles):
+        """
+        Retrieves citation data for all articles that provide a
+        citation link but don't yet carry the data.
+        """
+        pending = [art for art in articles
+                   if art['url_citation'] is not None
+                   and art.citation_data is None]
+        if len(pending) == 0:
+            return
+
+        num_workers = min(self.workers, len(pending))
+        if num_workers == 1:
+            for art in pending:
+                self.querier.get_citation_data(art)
+            return
+
+        work = queue.Queue()
+        for art in pending:
+            work.put(art)
+
+        threads = []
+        for _ in range(num_workers):
+            thread = threading.Thread(target=self._worker, args=(work,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    def _worker(self, work):
+        while True:
+            try:
+                art = work.get_nowait()
+            except queue.Empty:
+                return
+            slot = self._get_host_slot(art['url_citation'])
+            with slot:
+                self.querier.get_citation_data(art)
+
+    def _get_host_slot(self, url):
+        host = urlparse(url).netloc
+        with self._host_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+
+class ScholarConnectionPool(object):
+    """
+    A thread-safe pool of persistent HTTP(S) connections, keyed by
+    scheme, host and port. A connection is used by one request at a
+    time; once its response is read completely, it returns to the pool
+    for reuse. At most `size` idle connections are kept per host.
+    """
+    def __init__(self, size=None):
+        self.size = max(1, size or ScholarConf.HTTP_POOL_SIZE)
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, scheme, host, timeout=None):
+        """
+        Returns a tuple of a connected connection to the given host and
+        a flag indicating whether the connection got reused.
+        """
+        key = (scheme, host)
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                ScholarUtils.log('info', 'reusing connection to %s://%s', scheme, host)
+                return idle.pop(), True
+
+        ScholarUtils.log('debug', 'opening new connection to %s://%s', scheme, host)
+        conn_class = http_client.HTTPSConnection if scheme == 'https' \
+            else http_client.HTTPConnection
+        if timeout is None:
+            conn = conn_class(host)
+        else:
+            conn = conn_class(host, timeout=timeout)
+
+        start = time.time()
+        conn.connect()
+        ScholarUtils.log('info', 'connected to %s://%s in %.1f ms',
+                         scheme, host, 1000 * (time.time() - start))
+        return conn, False
+
+    def put(self, scheme, host, conn):
+        """
+        Returns a connection to the pool, closing it if the pool is
+        full.
+        """
+        with self._lock:
+            idle = self._idle.setdefault((scheme, host), [])
+            if len(idle) < self.size:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class ScholarPooledResponse(object):
+    """
+    A file-like reader for the payload of a response received over a
+    pooled connection. Compressed payloads get decoded as they are
+    read. Once the payload got read completely, or the reader gets
+    closed, the connection returns to the pool.
+    """
+    def __init__(self, pool, scheme, host, conn, resp, encoding=None):
+        self.pool = pool
+        self.scheme = scheme
+        self.host = host
+        self.encoding = encoding
+        self._conn = conn
+        self._resp = resp
+        self._decoder = None
+        if encoding in ('gzip', 'x-gzip'):
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decoder = zlib.decompressobj()
+        self._started = False
+
+    def read(self, amt=None):
+        """
+        Returns up to amt bytes of the decoded payload, or all of the
+        remainder if amt is None. Returns an empty string at the end of
+        the payload.
+        """
+        res = []
+        while self._resp is not None:
+            data = self._resp.read() if amt is None else self._resp.read(amt)
+            if not data:
+                if self._decoder is not None:
+                    res.append(self._decoder.flush())
+                self._release()
+                break
+            res.append(self._decode(data))
+            # Compressed data may not yield output right away:
+            if amt is not None and res[-1]:
+                break
+        return b''.join(res)
+
+    def close(self):
+        """
+        Releases the connection. An unread remainder of the payload
+        gets discarded, so the connection remains usable.
+        """
+        if self._resp is None:
+            return
+        try:
+            self._resp.read()
+        except (EnvironmentError, http_client.HTTPException):
+            self._conn.close()
+            self._conn, self._resp = None, None
+            return
+        self._release()
+
+    def _decode(self, data):
+        if self._decoder is None:
+            return data
+        if not self._started and self.encoding == 'deflate':
+            self._started = True
+            try:
+                return self._decoder.decompress(data)
+            except zlib.error:
+                # Some servers send raw deflate streams without zlib header.
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decoder.decompress(data)
+
+    def _release(self):
+        conn, resp = self._conn, self._resp
+        self._conn, self._resp = None, None
+        if resp.will_close:
+            conn.close()
+        else:
+            self.pool.put(self.scheme, self.host, conn)
+
+
+class ScholarKeepAliveHandler(object):
+    """
+    A urllib handler sending HTTP and HTTPS requests over pooled,
+    persistent connections. Response payloads can be read
+    incrementally, and compressed ones get decoded on the fly; see
+    ScholarPooledResponse.
+
+    The handler deliberately doesn't derive from urllib's handler
+    classes, so defining it doesn't require importing urllib. It runs
+    ahead of the stock HTTP(S) handlers, which remain in place for the
+    requests it declines.
+    """
+    handler_order = 400 # Before urllib's default of 500
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.parent = None
+
+    def add_parent(self, parent):
+        self.parent = parent
+
+    def close(self):
+        pass
+
+    def __lt__(self, other):
+        # The opener keeps its handlers sorted by this order.
+        return self.handler_order < getattr(other, 'handler_order', 500)
+
+    def http_open(self, req):
+        return self._open_pooled(req, 'http')
+
+    def https_open(self, req):
+        return self._open_pooled(req, 'https')
+
+    def _open_pooled(self, req, scheme):
+        # Tunnelled (proxied HTTPS) requests need the stock machinery.
+        if getattr(req, '_tunnel_host', None):
+            return None
+
+        host = getattr(req, 'host', None) or req.get_host()
+        selector = getattr(req, 'selector', None) or req.get_selector()
+        timeout = getattr(req, 'timeout', None)
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((key, val) for key, val in req.headers.items()
+                            if key not in headers))
+        headers['Connection'] = 'keep-alive'
+        if ScholarConf.HTTP_COMPRESSION:
+            headers['Accept-Encoding'] = 'gzip, deflate'
+
+        while True:
+            conn, reused = self.pool.get(scheme, host, timeout)
+            try:
+                conn.request(req.get_method(), selector, req.data, headers)
+                resp = conn.getresponse()
+                break
+            except (EnvironmentError, http_client.HTTPException) as err:
+                conn.close()
+                # The server may have dropped an idle connection; retry
+                # such failures once on a fresh connection.
+                if not reused:
+                    raise urllib_request.URLError(err)
+                ScholarUtils.log('debug', 'stale connection to %s: %s', host, err)
+
+        msg = resp.msg
+        encoding = (msg.get('Content-Encoding') or '').strip().lower()
+        if encoding in ('gzip', 'x-gzip', 'deflate'):
+            del msg['Content-Encoding']
+            del msg['Content-Length']
+        else:
+            encoding = None
+
+        body = ScholarPooledResponse(self.pool, scheme, host, conn, resp, encoding)
+        res = urllib_request.addinfourl(body, msg, req.get_full_url(), resp.status)
+        res.msg = resp.reason
+        return res
+
+
+class ScholarQuerier(object):
+    """
+    ScholarQuerier instances can conduct a search on Google Scholar
+    with subsequent parsing of the resulting HTML content. search()
+    returns the articles found and the global result attributes as a
+    ScholarResult of their own, so several threads can share a querier:
+    the opener, cookie jar, connection pool and caches it holds are
+    safe for concurrent use. send_query() instead collects the articles
+    found in the articles member, a list of ScholarArticle instances,
+    and is therefore meant for use by a single thread. Pass an existing
+    cookie jar, e.g. another querier's cjar member, to share cookie
+    state between queriers.
+    """
+
+    # Default URLs for visiting and submitting Settings pane, as of 3/14
+    GET_SETTINGS_URL = ScholarConf.SCHOLAR_SITE + '/scholar_settings?' \
+        + 'sciifh=1&hl=en&as_sdt=0,5'
+
+    SET_SETTINGS_URL = ScholarConf.SCHOLAR_SITE + '/scholar_setprefs?' \
+        + 'q=' \
+        + '&scisig=%(scisig)s' \
+        + '&inststart=0' \
+        + '&as_sdt=1,5' \
+        + '&as_sdtp=' \
+        + '&num=%(num)s' \
+        + '&scis=%(scis)s' \
+        + '%(scisf)s' \
+        + '&hl=en&lang=all&instq=&inst=569367360547434339&save='
+
+    # Older URLs:
+    # ScholarConf.SCHOLAR_SITE + '/scholar?q=%s&hl=en&btnG=Search&as_sdt=2001&as_sdtp=on
+
+    # The cookie in which Scholar keeps the session's preferences:
+    SETTINGS_COOKIE = 'GSP'
+
+    class Parser(ScholarArticleParser120726):
+        """
+        Hands the parsed articles and result count to the given
+        ScholarResult, or without one, to the querier's articles and
+        query members.
+        """
+        def __init__(self, querier, result=None, max_articles=None):
+            ScholarArticleParser120726.__init__(self, max_articles=max_articles)
             self.querier = querier
+            self.result = result
 
         def handle_num_results(self, num_results):
-            if self.querier is not None and self.querier.query is not None:
+            if self.result is not None:
+                self.result['num_results'] = num_results
+            elif self.querier is not None and self.querier.query is not None:
                 self.querier.query['num_results'] = num_results
 
         def handle_article(self, art):
-            self.querier.add_article(art)
+            self.querier.add_article(art, self.result)
 
-    def __init__(self):
+    class PageStream(object):
+        """
+        Parses results pages for search() into the given ScholarResult
+        in chunks, as they arrive. Calling the instance starts parsing
+        a new response and returns the callable consuming its chunks
+        (see _get_http_response()), so a request retried after e.g. a
+        CAPTCHA doesn't leave articles of a previous response behind.
+        Parsing stops once max_articles articles got found, if given.
+        Parsing errors get raised by finish().
+        """
+        def __init__(self, querier, result, max_articles=None):
+            self.querier = querier
+            self.result = result
+            self.max_articles = max_articles
+            self.parser = None
+            self.seconds = 0.0
+            self.error = None
+
+        def __call__(self):
+            self.result.articles = []
+            self.parser = self.querier.Parser(self.querier, self.result,
+                                              self.max_articles)
+            self.seconds = 0.0
+            self.error = None
+            return self.feed
+
+        def feed(self, chunk):
+            if self.error is not None:
+                return
+            start = time.time()
+            try:
+                self.parser.feed(chunk)
+            except Exception as err:
+                self.error = err
+            self.seconds += time.time() - start
+
+        def discard(self):
+            """
+            Drops the articles parsed so far, for a response that failed
+            partway through.
+            """
+            self.result.articles = []
+            self.parser = None
+            self.error = None
+
+        def finish(self):
+            """
+            Completes parsing of the page, retrieving the citation
+            data of its articles.
+            """
+            if self.error is not None:
+                raise self.error
+            articles = self.result.articles
+            self.querier._count_parse(time.time() - self.seconds, len(articles))
+            self.querier.citation_fetcher.fetch(articles)
+
+    def __init__(self, cjar=None):
         self.articles = []
         self.query = None
-        self.cjar = MozillaCookieJar()
+        self.cjar = cjar if cjar is not None else self._load_cookie_jar()
+        self.pool = None
+        handlers = [urllib_request.HTTPCookieProcessor(self.cjar)]
+        if ScholarConf.HTTP_KEEPALIVE:
+            self.pool = ScholarConnectionPool()
+            handlers.append(ScholarKeepAliveHandler(self.pool))
+        self.opener = urllib_request.build_opener(*handlers)
+        self.settings = None # Last settings object, if any
+        self.settings_state = self._load_settings_state()
+        self.citation_fetcher = ScholarCitationFetcher(self)
+        self.cache = self._make_cache()
+        self.store = self._make_store()
+        self.archive = self._make_archive()
+        self.parse_pool = self._make_parse_pool()
+        self.metrics = ScholarMetrics()
+        self.counts = {} # Result counts by normalized query
+
+        # Guards the settings state and result counts, and serializes
+        # applying settings, for threads sharing the querier:
+        self._lock = threading.Lock()
+        self._settings_lock = threading.Lock()
+
+        # Concurrent requests for the same URL share a single request.
+        # Replace this with an instance shared with other queriers to
+        # coalesce their requests as well:
+        self.flights = ScholarSingleFlight()
+
+        # Replace this with a scheduler shared with other queriers to
+        # pace all their requests jointly:
+        self.scheduler = ScholarRequestScheduler()
+
+    def apply_settings(self, settings):
+        """
+        Applies settings as provided by a ScholarSettings instance.
+        """
+        if settings is None or not settings.is_configured():
+            return True
+
+        with self._settings_lock:
+            self.settings = settings
+
+            if self._is_settings_applied(settings):
+                ScholarUtils.log('info', 'settings already in effect')
+                return True
+
+            # This is a bit of work. We need to actually retrieve the
+            # contents of the Settings pane HTML in order to extract
+            # hidden fields before we can compose the query for
+            # updating the settings.
+            html = self._get_http_response(url=self.GET_SETTINGS_URL,
+                                           log_msg='dump of settings form HTML',
+                                           err_msg='requesting settings failed')
+            if html is None:
+                return False
+
+            url = self._get_set_settings_url(settings, html)
+            if url is None:
+                return False
+
+            html = self._get_http_response(url=url,
+                                           log_msg='dump of settings result HTML',
+                                           err_msg='applying setttings failed')
+            if html is None:
+                return False
+
+            self._remember_settings(settings)
+            ScholarUtils.log('info', 'settings applied')
+            return True
+
+    def search(self, query, max_articles=None):
+        """
+        This method sends a search query (a ScholarQuery instance) and
+        returns a ScholarResult holding the parsed response. The given
+        query remains unchanged, and so does the querier's state, so
+        threads sharing the querier may search concurrently. If
+        max_articles is given, parsing of the page stops once that many
+        articles got found.
+        """
+        return self._finish_search(*self._start_search(query, max_articles))
+
+    def send_query(self, query):
+        """
+        This method initiates a search query (a ScholarQuery instance)
+        with subsequent parsing of the response. The articles found end
+        up in the articles member, and the global result attributes in
+        the query. Returns the ScholarResult, see search().
+        """
+        self.clear_articles()
+        self.query = query
+        result = self.search(query)
+        self._adopt_result(query, result)
+        return result
+
+    def iter_results(self, query, limit=None):
+        """
+        This generator sends the given query and yields the resulting
+        ScholarArticle instances, moving on to subsequent results pages
+        as needed. Pages are retrieved lazily, i.e. only once all
+        articles of the previous page have been consumed. Iteration
+        ends after `limit` articles, once a page yields no articles, or
+        once the total number of results reported by Scholar is
+        exhausted. The query's num_results attribute gets updated.
+        Like search(), this is safe to use from several threads.
+
+        When parsing in worker processes, the next page gets requested
+        while the current one parses, provided the reported total and
+        the limit show that it will be needed.
+        """
+        if limit is not None and limit <= 0:
+            return
+
+        page = copy.deepcopy(query)
+        page_size = page.num_results or ScholarConf.MAX_PAGE_RESULTS
+        start = page.start or 0
+        count = 0
+
+        def request(start, count):
+            # Don't request or parse more results than we will report,
+            # so we don't retrieve citation data needlessly:
+            max_articles = None
+            if limit is not None:
+                max_articles = limit - count
+                if max_articles < page_size:
+                    page.set_num_page_results(max_articles)
+            page.set_start(start)
+            if self.parse_pool is None:
+                return self.search(page, max_articles), None
+            return self._start_search(page)
+
+        num_results = None # As reported by the previous page
+        current = request(start, count)
+        while True:
+            following = None
+            if current[1] is not None and num_results \
+               and start + page_size < num_results \
+               and (limit is None or count + page_size < limit):
+                following = request(start + page_size, count + page_size)
+
+            result = self._finish_search(*current)
+            num_results = result['num_results']
+            if num_results is not None:
+                query['num_results'] = num_results
+            if len(result.articles) == 0:
+                return
+
+            for art in result.articles:
+                yield art
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+            start += page_size
+            if num_results and start >= num_results:
+                return
+            current = following or request(start, count)
+
+    def get_num_results(self, query):
+        """
+        Returns the total number of results Scholar reports for the
+        given query, or None if it cannot be determined. This requests
+        a results page of minimal size and parses it only up to the
+        global results header. Counts get cached per normalized query,
+        for the lifetime of the querier and in the response cache, if
+        configured. The query's num_results attribute gets updated.
+        """
+        key = self._get_count_key(query)
+        num_results = self._get_cached_count(key)
+        if num_results is None:
+            probe = copy.deepcopy(query)
+            probe.set_num_page_results(1)
+            probe.set_start(0)
+            html = self._get_http_response(url=probe.get_url(),
+                                           log_msg='dump of count probe HTML',
+                                           err_msg='count retrieval failed')
+            if html is None:
+                return None
+            num_results = self._set_cached_count(key, html)
+
+        query['num_results'] = num_results
+        return num_results
+
+    def get_citation_data(self, article):
+        """
+        Given an article, retrieves citation link. Note, this requires that
+        you adjusted the settings to tell Google Scholar to actually
+        provide this information, *prior* to retrieving the article.
+        """
+        if article['url_citation'] is None:
+            return False
+        if article.citation_data is not None:
+            return True
+
+        ScholarUtils.log('info', 'retrieving citation export data')
+        data = self._get_http_response(url=article['url_citation'],
+                                       log_msg='citation data response',
+                                       err_msg='requesting citation data failed',
+                                       cache_kind=ScholarCache.KIND_CITATION)
+        if data is None:
+            return False
+
+        article.set_citation_data(data)
+        if self.store is not None:
+            self.store.set_citation_data(article, data, self._get_citation_format())
+        return True
+
+    def parse(self, html):
+        """
+        This method allows parsing of provided HTML content, adding the
+        articles found to the articles member.
+        """
+        self._parse(html, self.Parser(self), self.articles)
+
+    def add_article(self, art, result=None):
+        """
+        Adds the given article to the given ScholarResult, or without
+        one, to the articles member.
+        """
+        if self.store is not None:
+            self.store.add(art)
+            # Reuse a stored citation export, sparing us its retrieval:
+            if art.citation_data is None and art['url_citation'] is not None:
+                data = self.store.get_citation_data(art, self._get_citation_format())
+                if data is not None:
+                    art.set_citation_data(data)
+        if result is not None:
+            result.articles.append(art)
+        else:
+            self.articles.append(art)
+
+    def clear_articles(self):
+        """Clears any existing articles stored from previous queries."""
+        self.articles = []
+
+    def _parse(self, html, parser, articles):
+        """
+        Helper, parses the given page via the given parser, which adds
+        the articles found to the given list, and retrieves their
+        citation data.
+        """
+        num_articles = len(articles)
+        start = time.time()
+        if self.parse_pool is not None:
+            self.parse_pool.parse(html, parser)
+        else:
+            parser.parse(html)
+        self._count_parse(start, len(articles) - num_articles)
+
+        # Citation exports require one request per article, so we
+        # retrieve them in parallel once the whole page is parsed.
+        self.citation_fetcher.fetch(articles)
+
+    def _start_search(self, query, max_articles=None):
+        """
+        Helper for search(), retrieves the results page for the given
+        query. Returns the ScholarResult and, when parsing in worker
+        processes, the pending parse of the page, to be completed via
+        _finish_search(). Otherwise the page is parsed already, up to
+        max_articles articles, if given.
+        """
+        result = ScholarResult(query)
+
+        stream = None
+        if ScholarConf.PARSE_STREAMING and self.parse_pool is None:
+            stream = self.PageStream(self, result, max_articles)
+
+        html = self._get_http_response(url=result.query.get_url(),
+                                       log_msg='dump of query response HTML',
+                                       err_msg='results retrieval failed',
+                                       cache_kind=ScholarCache.KIND_RESULTS,
+                                       stream=stream)
+        if html is None:
+            if stream is not None:
+                stream.discard()
+            return result, None
+
+        result.retrieved = True
+        if self.parse_pool is not None:
+            return result, (self.parse_pool.submit(html), time.time())
+        if stream is not None:
+            stream.finish()
+        else:
+            self._parse(html, self.Parser(self, result, max_articles),
+                        result.articles)
+        return result, None
+
+    def _finish_search(self, result, pending):
+        """
+        Helper for search(), completes the given ScholarResult with the
+        outcome of its page's pending parse, if any (see
+        _start_search()), and returns it.
+        """
+        if pending is not None:
+            future, start = pending
+            self.parse_pool.replay(future.result(), self.Parser(self, result))
+            self._count_parse(start, len(result.articles))
+            self.citation_fetcher.fetch(result.articles)
+        return result
+
+    def _adopt_result(self, query, result):
+        """
+        Helper for send_query(), moves the given ScholarResult's
+        articles into the articles member and its global result
+        attributes into the given query.
+        """
+        self.articles = result.articles
+        for key in result.query.attrs:
+            query[key] = result[key]
+
+    @staticmethod
+    def _load_cookie_jar():
+        """
+        Helper, returns a cookie jar populated from the configured
+        cookie file, if any.
+        """
+        cjar = cookiejar.MozillaCookieJar()
 
         # If we have a cookie file, load it:
         if ScholarConf.COOKIE_JAR_FILE and \
            os.path.exists(ScholarConf.COOKIE_JAR_FILE):
             try:
-                self.cjar.load(ScholarConf.COOKIE_JAR_FILE,
-                               ignore_discard=True)
+                cjar.load(ScholarConf.COOKIE_JAR_FILE,
+                          ignore_discard=True)
                 ScholarUtils.log('info', 'loaded cookies file')
             except Exception as msg:
-                ScholarUtils.log('warn', 'could not load cookies file: %s' % msg)
-                self.cjar = MozillaCookieJar() # Just to be safe
+                ScholarUtils.log('warn', 'could not load cookies file: %s', msg)
+                cjar = cookiejar.MozillaCookieJar() # Just to be safe
+        return cjar
 
-        self.opener = build_opener(HTTPCookieProcessor(self.cjar))
-        self.settings = None # Last settings object, if any
+    @staticmethod
+    def _get_settings_state_file():
+        """
+        Helper, returns the name of the file recording the settings in
+        effect for the configured cookie file, or None.
+        """
+        if ScholarConf.COOKIE_JAR_FILE is None:
+            return None
+        return ScholarConf.COOKIE_JAR_FILE + '.settings'
+
+    @classmethod
+    def _load_settings_state(cls):
+        """
+        Helper, returns the recorded settings state for the configured
+        cookie file, or None.
+        """
+        fname = cls._get_settings_state_file()
+        if fname is None or not os.path.exists(fname):
+            return None
+        try:
+            with open(fname) as hdl:
+                return json.load(hdl)
+        except Exception as msg:
+            ScholarUtils.log('warn', 'could not load settings state: %s', msg)
+            return None
+
+    def _save_settings_state(self):
+        """
+        Helper, records the settings state next to the cookie file.
+        """
+        fname = self._get_settings_state_file()
+        with self._lock:
+            state = self.settings_state
+        if fname is None or state is None:
+            return
+        try:
+            with open(fname, 'w') as hdl:
+                json.dump(state, hdl)
+        except Exception as msg:
+            ScholarUtils.log('warn', 'could not save settings state: %s', msg)
+
+    def _get_settings_cookie(self):
+        """
+        Helper, returns the cookie carrying Scholar's preferences, or
+        None.
+        """
+        host = urlparse(ScholarConf.SCHOLAR_SITE).hostname or ''
+        # The jar's lock keeps other threads' responses from changing
+        # its cookies while we iterate over them:
+        with self.cjar._cookies_lock:
+            for cookie in self.cjar:
+                if cookie.name == self.SETTINGS_COOKIE \
+                   and host.endswith(cookie.domain.lstrip('.')):
+                    return cookie
+        return None
+
+    def _is_settings_applied(self, settings):
+        """
+        Helper, predicate indicating whether the cookie jar still
+        carries the preferences we established for the given settings:
+        their fingerprint must match the one recorded when we applied
+        them, and the preferences cookie must be the one Scholar set
+        back then and not have expired.
+        """
+        with self._lock:
+            state = self.settings_state
+        if state is None or state.get('fingerprint') != settings.get_fingerprint():
+            return False
+        cookie = self._get_settings_cookie()
+        return cookie is not None and not cookie.is_expired() \
+            and cookie.expires == state.get('expires')
+
+    def _remember_settings(self, settings):
+        """
+        Helper, records that the given settings are now in effect.
+        """
+        cookie = self._get_settings_cookie()
+        with self._lock:
+            self.settings_state = {
+                'fingerprint': settings.get_fingerprint(),
+                'expires': cookie.expires if cookie is not None else None,
+            }
+
+    def _get_citation_format(self):
+        """
+        Helper, returns the citation export format currently requested
+        from Scholar, see ScholarSettings.
+        """
+        if self.settings is None:
+            return ScholarSettings.CITFORM_NONE
+        return self.settings.citform
+
+    @staticmethod
+    def _make_store():
+        """
+        Helper, returns a ScholarArticleStore if one is configured, None
+        otherwise.
+        """
+        if ScholarConf.STORE_FILE is None:
+            return None
+        try:
+            return ScholarArticleStore(ScholarConf.STORE_FILE)
+        except Exception as msg:
+            ScholarUtils.log('warn', 'could not open article store: %s', msg)
+            return None
+
+    def _make_parse_pool(self):
+        """
+        Helper, returns a ScholarParserPool running our Parser's closest
+        module-level ancestor, if parsing in worker processes is
+        configured, None otherwise.
+        """
+        if ScholarConf.PARSE_PROCESSES <= 0:
+            return None
+        if not futures.is_available():
+            ScholarUtils.log('warn', 'parsing in worker processes needs '
+                             'concurrent.futures, parsing in-process')
+            return None
+        for cls in self.Parser.__mro__:
+            if globals().get(cls.__name__) is cls:
+                return ScholarParserPool(cls.__name__, ScholarConf.PARSE_PROCESSES)
+        return None
+
+    @staticmethod
+    def _make_archive():
+        """
+        Helper, returns a ScholarArchive if one is configured, None
+        otherwise.
+        """
+        if ScholarConf.ARCHIVE_DIR is None:
+            return None
+        try:
+            return ScholarArchive(ScholarConf.ARCHIVE_DIR)
+        except Exception as msg:
+            ScholarUtils.log('warn', 'could not open response archive: %s', msg)
+            return None
+
+    @staticmethod
+    def _make_cache():
+        """
+        Helper, returns a ScholarCache if caching is configured, None
+        otherwise.
+        """
+        if ScholarConf.CACHE_DIR is None:
+            return None
+        try:
+            return ScholarCache(ScholarConf.CACHE_DIR)
+        except Exception as msg:
+            ScholarUtils.log('warn', 'could not open response cache: %s', msg)
+            return None
 
-    def apply_settings(self, settings):
+    def _get_cache_key(self, url):
         """
-        Applies settings as provided by a ScholarSettings instance.
+        Helper, returns the cache key for a URL. The content of results
+        pages depends on the applied settings (e.g. whether citation
+        export links are present), so those go into the key as well.
         """
-        if settings is None or not settings.is_configured():
-            return True
-
-        self.settings = settings
+        if self.settings is None:
+            return url
+        return '%s#citform=%s&num=%s' % (url, self.settings.citform,
+                                         self.settings.per_page_results)
 
-        # This is a bit of work. We need to actually retrieve the
-        # contents of the Settings pane HTML in order to extract
-        # hidden fields before we can compose the query for updating
-        # the settings.
-        html = self._get_http_response(url=self.GET_SETTINGS_URL,
-                                       log_msg='dump of settings form HTML',
-                                       err_msg='requesting settings failed')
-        if html is None:
-            return False
+    @staticmethod
+    def _get_count_key(query):
+        """
+        Helper, returns the key under which we cache the result count
+        of the given query. The key normalizes the query's URL: it
+        omits paging and empty arguments, and sorts the remaining ones,
+        ignoring case and redundant whitespace in their values.
+        """
+        query = copy.deepcopy(query)
+        query.num_results, query.start = None, None
+        args = []
+        for arg in urlparse(query.get_url()).query.split('&'):
+            key, _, val = arg.partition('=')
+            val = ' '.join(unquote(val).lower().split())
+            if val:
+                args.append('%s=%s' % (key, val))
+        return 'count:' + '&'.join(sorted(args))
+
+    def _get_cached_count(self, key):
+        """
+        Helper, returns the cached result count for the given key, or
+        None if we have none.
+        """
+        with self._lock:
+            num_results = self.counts.get(key)
+        if num_results is not None:
+            self.metrics.incr('count_cache_hits')
+            return num_results
+        if self.cache is not None:
+            data = self.cache.get(key, ScholarCache.KIND_COUNT)
+            if data is not None:
+                self.metrics.incr('count_cache_hits')
+                with self._lock:
+                    self.counts[key] = int(data)
+                return int(data)
+        return None
 
+    def _set_cached_count(self, key, html):
+        """
+        Helper, parses the result count from the given count probe
+        response, caches it under the given key, and returns it.
+        """
+        start = time.time()
+        num_results = ScholarCountParser().parse(html)
+        self.metrics.incr('count_probes')
+        self.metrics.observe('parse_seconds', time.time() - start)
+        if num_results is not None:
+            with self._lock:
+                self.counts[key] = num_results
+            if self.cache is not None:
+                self.cache.put(key, ScholarCache.KIND_COUNT,
+                               str(num_results).encode('ascii'))
+        return num_results
+
+    def _get_set_settings_url(self, settings, html):
+        """
+        Helper, parses the Settings pane HTML and returns the URL that
+        submits the given settings, or None if the form wasn't usable.
+        """
         # Now parse the required stuff out of the form. We require the
         # "scisig" token to make the upload of our settings acceptable
         # to Google.
@@ -985,12 +3377,12 @@ class ScholarQuerier(object):
         tag = soup.find(name='form', attrs={'id': 'gs_settings_form'})
         if tag is None:
             ScholarUtils.log('info', 'parsing settings failed: no form')
-            return False
+            return None
 
         tag = tag.find('input', attrs={'type':'hidden', 'name':'scisig'})
         if tag is None:
             ScholarUtils.log('info', 'parsing settings failed: scisig')
-            return False
+            return None
 
         urlargs = {'scisig': tag['value'],
                    'num': settings.per_page_results,
@@ -1001,149 +3393,1128 @@ class ScholarQuerier(object):
             urlargs['scis'] = 'yes'
             urlargs['scisf'] = '&scisf=%d' % settings.citform
 
-        html = self._get_http_response(url=self.SET_SETTINGS_URL % urlargs,
-                                       log_msg='dump of settings result HTML',
-                                       err_msg='applying setttings failed')
-        if html is None:
-            return False
+        return self.SET_SETTINGS_URL % urlargs
 
-        ScholarUtils.log('info', 'settings applied')
+    def save_cookies(self):
+        """
+        This stores the latest cookies we're using to disk, for reuse in a
+        later session.
+        """
+        if ScholarConf.COOKIE_JAR_FILE is None:
+            return False
+        try:
+            with self.cjar._cookies_lock:
+                self.cjar.save(ScholarConf.COOKIE_JAR_FILE,
+                               ignore_discard=True)
+            ScholarUtils.log('info', 'saved cookies file')
+        except Exception as msg:
+            ScholarUtils.log('warn', 'could not save cookies file: %s', msg)
+            return False
+        self._save_settings_state()
         return True
 
-    def send_query(self, query):
+    def close(self):
         """
-        This method initiates a search query (a ScholarQuery instance)
-        with subsequent parsing of the response.
+        Closes the persistent connections, article store, response
+        archive and parser processes held by this querier.
         """
-        self.clear_articles()
-        self.query = query
+        if self.pool is not None:
+            self.pool.close()
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        if self.parse_pool is not None:
+            self.parse_pool.close()
+            self.parse_pool = None
+
+    def _get_http_response(self, url, log_msg=None, err_msg=None,
+                           cache_kind=None, stream=None):
+        """
+        Helper method, sends HTTP request and returns response payload.
+        If cache_kind is given and a cache is configured, a fresh cached
+        payload gets returned without touching the network, and new
+        payloads get cached. If stream is given, it gets called for
+        every response received (or cached payload) and must return a
+        callable, which then gets invoked with each chunk of the
+        payload as it arrives.
+
+        Concurrent calls for the same URL, e.g. from the citation
+        fetcher's threads or from queriers sharing our flights member,
+        share a single request and its payload.
+        """
+        if log_msg is None:
+            log_msg = 'HTTP response data follow'
+        if err_msg is None:
+            err_msg = 'request failed'
 
-        html = self._get_http_response(url=query.get_url(),
-                                       log_msg='dump of query response HTML',
-                                       err_msg='results retrieval failed')
-        if html is None:
-            return
+        cache_key = self._get_cache_key(url)
+        if cache_kind is not None and self.cache is not None:
+            data = self.cache.get(cache_key, cache_kind)
+            if data is not None:
+                self.metrics.incr('cache_hits')
+                ScholarUtils.log('info', 'cache hit for %s', unquote(url))
+                if stream is not None:
+                    stream()(data)
+                return data
+            self.metrics.incr('cache_misses')
+
+        html, shared = self.flights.call(cache_key, lambda: self._fetch_http_response(
+            url, log_msg, err_msg, cache_key, cache_kind, stream))
+        if shared:
+            self.metrics.incr('coalesced_requests')
+            ScholarUtils.log('info', 'shared in-flight request for %s', unquote(url))
+            if html is not None and stream is not None:
+                stream()(html)
+        return html
+
+    def _fetch_http_response(self, url, log_msg, err_msg, cache_key,
+                             cache_kind, stream):
+        """
+        Helper for _get_http_response(), retrieves and caches a payload
+        not found in the cache.
+        """
+        try:
+            ScholarUtils.log('info', 'requesting %s', unquote(url))
 
-        self.parse(html)
+            hdl, html = self.scheduler.call(lambda: self._send_request(url, stream))
 
-    def get_citation_data(self, article):
+            if ScholarUtils.log_enabled('debug'):
+                ScholarUtils.log('debug', log_msg)
+                ScholarUtils.log('debug', '>>>>' + '-'*68)
+                ScholarUtils.log('debug', 'url: %s', hdl.geturl())
+                ScholarUtils.log('debug', 'result: %s', hdl.getcode())
+                ScholarUtils.log('debug', 'headers:\n%s', hdl.info())
+                ScholarUtils.log('debug', 'data:\n%s', html.decode('utf-8', 'replace')) # For Python 3
+                ScholarUtils.log('debug', '<<<<' + '-'*68)
+
+            if cache_kind is not None and self.cache is not None:
+                self.cache.put(cache_key, cache_kind, html)
+            if self.archive is not None:
+                self.archive.put(url, html, cache_kind)
+
+            return html
+        except ThrottledError as err:
+            self.metrics.incr('request_failures')
+            ScholarUtils.log('warn', err_msg + ': %s', err)
+            return None
+        except Exception as err:
+            self.metrics.incr('request_failures')
+            ScholarUtils.log('info', err_msg + ': %s', err)
+            return None
+
+    def _count_request(self, start, html):
         """
-        Given an article, retrieves citation link. Note, this requires that
-        you adjusted the settings to tell Google Scholar to actually
-        provide this information, *prior* to retrieving the article.
+        Helper, updates the metrics for a network request that started
+        at the given time and yielded the given payload.
         """
-        if article['url_citation'] is None:
-            return False
-        if article.citation_data is not None:
-            return True
+        self.metrics.incr('requests')
+        self.metrics.incr('bytes_downloaded', len(html))
+        self.metrics.observe('request_seconds', time.time() - start)
+        self.metrics.observe('response_bytes', len(html))
 
-        ScholarUtils.log('info', 'retrieving citation export data')
-        data = self._get_http_response(url=article['url_citation'],
-                                       log_msg='citation data response',
-                                       err_msg='requesting citation data failed')
-        if data is None:
-            return False
+    def _count_parse(self, start, num_articles):
+        """
+        Helper, updates the metrics for a results page whose parsing
+        started at the given time and yielded the given number of
+        articles.
+        """
+        self.metrics.incr('pages_parsed')
+        self.metrics.incr('articles', num_articles)
+        self.metrics.observe('parse_seconds', time.time() - start)
+        self.metrics.observe('page_articles', num_articles)
 
-        article.set_citation_data(data)
-        return True
+    def get_metrics(self):
+        """
+        Returns the querier's ScholarMetrics, updated with the request
+        scheduler's counters.
+        """
+        for key, val in self.scheduler.get_counters().items():
+            self.metrics.set('scheduler_' + key, val)
+        return self.metrics
 
-    def parse(self, html):
+    def _send_request(self, url, stream=None):
         """
-        This method allows parsing of provided HTML content.
+        Helper method, sends a single HTTP request and returns the
+        response handle and payload. The payload gets read in chunks,
+        passed to the stream as they arrive, if given (see
+        _get_http_response()). Raises ThrottledError if Scholar
+        rejected the request due to our request rate.
         """
-        parser = self.Parser(self)
-        parser.parse(html)
+        req = urllib_request.Request(url=url,
+                                     headers={'User-Agent': ScholarConf.USER_AGENT})
+        start = time.time()
+        try:
+            hdl = self.opener.open(req)
+        except urllib_request.HTTPError as err:
+            self.metrics.observe('request_seconds', time.time() - start)
+            err.close() # Releases a pooled connection
+            if err.code in (429, 503):
+                raise ThrottledError('HTTP %d' % err.code,
+                                     ScholarRequestScheduler.parse_retry_after(
+                                         err.headers.get('Retry-After')))
+            raise
+        feed = stream() if stream is not None else None
+        chunks = []
+        while True:
+            chunk = hdl.read(ScholarConf.READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            if feed is not None:
+                feed(chunk)
+        hdl.close()
+        html = b''.join(chunks)
+        self._count_request(start, html)
+        if self._is_captcha(hdl.geturl(), html):
+            raise ThrottledError('CAPTCHA')
+        return hdl, html
 
-    def add_article(self, art):
-        self.get_citation_data(art)
-        self.articles.append(art)
+    @staticmethod
+    def _is_captcha(url, html):
+        """
+        Helper, predicate indicating whether the given response is a
+        CAPTCHA challenge rather than the content we requested.
+        """
+        return '/sorry/' in url or b'gs_captcha_f' in html \
+            or b'g-recaptcha' in html
 
-    def clear_articles(self):
-        """Clears any existing articles stored from previous queries."""
-        self.articles = []
 
-    def save_cookies(self):
+class ScholarWatcher(object):
+    """
+    Tracks citation and version counts for a set of article clusters,
+    keeping their last known values in a SQLite database. Each call to
+    refresh() re-queries the clusters in order of priority (see
+    ScholarConf.WATCH_MIN_VELOCITY) until the request budget is spent,
+    and yields only those articles whose counts changed, including
+    clusters seen for the first time.
+    """
+    # How strongly the latest observation affects a cluster's velocity:
+    VELOCITY_WEIGHT = 0.5
+
+    def __init__(self, querier, path, budget=None):
+        self.querier = querier
+        self.budget = ScholarConf.WATCH_BUDGET if budget is None else budget
+        self._db = sqlite3.connect(path)
+        self._db.execute('CREATE TABLE IF NOT EXISTS clusters ('
+                         'cluster_id TEXT PRIMARY KEY, num_citations INTEGER, '
+                         'num_versions INTEGER, velocity REAL, '
+                         'checked REAL, changed REAL)')
+        self._db.commit()
+
+    def add(self, cluster_ids):
+        """Adds the given cluster IDs to the set of watched clusters."""
+        for cluster_id in cluster_ids:
+            self._db.execute('INSERT OR IGNORE INTO clusters (cluster_id, velocity) '
+                             'VALUES (?, 0)', (str(cluster_id),))
+        self._db.commit()
+
+    def get_schedule(self, now=None):
         """
-        This stores the latest cookies we're using to disk, for reuse in a
-        later session.
+        Returns the watched cluster IDs, most urgent first. Clusters
+        never checked come first, in the order they were added.
         """
-        if ScholarConf.COOKIE_JAR_FILE is None:
-            return False
-        try:
-            self.cjar.save(ScholarConf.COOKIE_JAR_FILE,
-                           ignore_discard=True)
-            ScholarUtils.log('info', 'saved cookies file')
-            return True
-        except Exception as msg:
-            ScholarUtils.log('warn', 'could not save cookies file: %s' % msg)
+        now = now or time.time()
+        rows = self._db.execute('SELECT cluster_id, velocity, checked '
+                                'FROM clusters ORDER BY rowid').fetchall()
+
+        def priority(row):
+            if row[2] is None:
+                return float('inf')
+            days = max(0.0, now - row[2]) / 86400.0
+            return (row[1] + ScholarConf.WATCH_MIN_VELOCITY) * days
+
+        return [row[0] for row in sorted(rows, key=priority, reverse=True)]
+
+    def refresh(self):
+        """
+        A generator that refreshes clusters within the request budget,
+        yielding a ScholarArticle for every cluster whose counts changed.
+        """
+        counters = self.querier.scheduler.get_counters
+        spent = counters()['requests']
+        for cluster_id in self.get_schedule():
+            if counters()['requests'] - spent >= self.budget:
+                ScholarUtils.log('info', 'watch request budget of %d spent', self.budget)
+                return
+            art = self._query(cluster_id)
+            if art is not None and self._update(cluster_id, art):
+                yield art
+
+    def close(self):
+        self._db.close()
+
+    def _query(self, cluster_id):
+        query = ClusterScholarQuery(cluster=cluster_id)
+        query.set_num_page_results(1)
+        result = self.querier.search(query)
+        for art in result.articles:
+            if art['cluster_id'] == cluster_id:
+                return art
+        if len(result.articles) > 0:
+            return result.articles[0]
+        ScholarUtils.log('info', 'no article for cluster %s', cluster_id)
+        return None
+
+    def _update(self, cluster_id, art):
+        now = time.time()
+        row = self._db.execute('SELECT num_citations, num_versions, velocity, '
+                               'checked FROM clusters WHERE cluster_id = ?',
+                               (cluster_id,)).fetchone()
+        citations = art['num_citations'] or 0
+        versions = art['num_versions'] or 0
+
+        changed = row[3] is None or (citations, versions) != (row[0], row[1])
+        velocity = row[2]
+        if row[3] is not None:
+            days = max(now - row[3], 3600.0) / 86400.0
+            rate = max(0, citations - (row[0] or 0)) / days
+            velocity = self.VELOCITY_WEIGHT * rate \
+                + (1 - self.VELOCITY_WEIGHT) * velocity
+            if changed:
+                ScholarUtils.log('info', 'cluster %s: citations %s -> %s, versions %s -> %s',
+                                 cluster_id, row[0], citations, row[1], versions)
+
+        self._db.execute('UPDATE clusters SET num_citations = ?, num_versions = ?, '
+                         'velocity = ?, checked = ?, changed = ? WHERE cluster_id = ?',
+                         (citations, versions, velocity, now,
+                          now if changed else None, cluster_id))
+        self._db.commit()
+        return changed
+
+
+class ScholarCrawler(object):
+    """
+    Crawls the citation graph outward from a set of seed articles,
+    following their "Cited by" lists to the given depth. For every
+    citing article found it writes an edge, a line holding the citing
+    and the cited article's cluster IDs separated by a tab, to the
+    given ScholarOutput.
+
+    Articles are identified by cluster ID, and each gets expanded at
+    most once. The frontier proceeds breadth-first, visiting the most
+    cited articles of each level first. Several threads expand articles
+    in parallel, all sharing the given querier. If a checkpoint file is
+    given, the crawl state gets saved there periodically, and a later
+    crawler can resume() from it, appending to the same edge list.
+    """
+    def __init__(self, querier, output=None, depth=1, max_nodes=None,
+                 workers=None, checkpoint=None, per_node=None):
+        self.querier = querier
+        self.output = output or ScholarOutput()
+        self.depth = depth
+        self.max_nodes = ScholarConf.CRAWL_MAX_NODES \
+            if max_nodes is None else max_nodes
+        self.workers = max(1, workers or ScholarConf.CRAWL_WORKERS)
+        self.checkpoint = checkpoint
+        # The maximum number of citing articles to retrieve per article:
+        self.per_node = per_node or ScholarConf.MAX_PAGE_RESULTS
+
+        self.visited = set()
+        self.frontier = [] # Heap of (depth, -num_citations, seq, cluster_id)
+        self.expanded = 0
+        self.edges = 0
+        self._seq = 0
+        self._inflight = {}
+        self._cond = threading.Condition()
+
+    def add_seeds(self, articles):
+        """Adds the given articles to the frontier, at depth zero."""
+        with self._cond:
+            for art in articles:
+                self._push(art, 0)
+
+    def resume(self):
+        """
+        Restores the crawl state from the checkpoint file, if any.
+        Returns True if a crawl got resumed.
+        """
+        if self.checkpoint is None or not os.path.exists(self.checkpoint):
             return False
+        with open(self.checkpoint) as hdl:
+            state = json.load(hdl)
+        with self._cond:
+            self.visited = set(state['visited'])
+            self.frontier = [tuple(node) for node in state['frontier']]
+            heapq.heapify(self.frontier)
+            self.expanded = state['expanded']
+            self.edges = state['edges']
+            self._seq = state['seq']
+        ScholarUtils.log('info', 'resuming crawl: %d articles expanded, %d queued',
+                         self.expanded, len(self.frontier))
+        return True
 
-    def _get_http_response(self, url, log_msg=None, err_msg=None):
+    def run(self):
         """
-        Helper method, sends HTTP request and returns response payload.
+        Crawls until the frontier is exhausted or max_nodes articles
+        got expanded.
         """
-        if log_msg is None:
-            log_msg = 'HTTP response data follow'
-        if err_msg is None:
-            err_msg = 'request failed'
+        threads = []
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+        with self._cond:
+            self._save_checkpoint()
+        ScholarUtils.log('info', 'crawl done: %d articles expanded, %d edges, %d queued',
+                         self.expanded, self.edges, len(self.frontier))
+
+    def _push(self, art, depth):
+        # Only articles we will expand go into the frontier:
+        cluster_id = art['cluster_id']
+        if cluster_id is None or cluster_id in self.visited \
+           or depth >= self.depth or not art['url_citations']:
+            return
+        self.visited.add(cluster_id)
+        heapq.heappush(self.frontier, (depth, -(art['num_citations'] or 0),
+                                       self._seq, cluster_id))
+        self._seq += 1
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self.frontier and self._inflight:
+                    self._cond.wait()
+                if not self.frontier or self.expanded >= self.max_nodes:
+                    return
+                node = heapq.heappop(self.frontier)
+                self._inflight[node[2]] = node
+                self.expanded += 1
+
+            depth, cluster_id = node[0], node[3]
+            ScholarUtils.log('info', 'expanding cluster %s at depth %d',
+                             cluster_id, depth)
+            try:
+                query = CitationsScholarQuery(cluster=cluster_id)
+                citing = list(self.querier.iter_results(query, limit=self.per_node))
+            except Exception as err:
+                ScholarUtils.log('warn', 'expanding cluster %s failed: %s',
+                                 cluster_id, err)
+                citing = []
+
+            with self._cond:
+                del self._inflight[node[2]]
+                for art in citing:
+                    if art['cluster_id'] is None:
+                        continue
+                    self.output.write('%s\t%s\n' % (art['cluster_id'], cluster_id))
+                    self.edges += 1
+                    self._push(art, depth + 1)
+                if self.expanded % ScholarConf.CRAWL_CHECKPOINT_EVERY == 0:
+                    self._save_checkpoint()
+                self._cond.notify_all()
+
+    def _save_checkpoint(self):
+        # The edges of articles being expanded are not written yet, so
+        # we queue those articles again for a resumed crawl.
+        if self.checkpoint is None:
+            return
+        self.output.flush()
+        state = {'visited': sorted(self.visited),
+                 'frontier': self.frontier + list(self._inflight.values()),
+                 'expanded': self.expanded - len(self._inflight),
+                 'edges': self.edges,
+                 'seq': self._seq}
+        tmp = self.checkpoint + '.tmp'
+        with open(tmp, 'w') as hdl:
+            json.dump(state, hdl)
+        getattr(os, 'replace', os.rename)(tmp, self.checkpoint)
+
+
+class ScholarQueryPlanner(object):
+    """
+    Retrieves the results of a search query beyond the number Scholar
+    lets us page through for any single query. If the query reports
+    more than `reachable` results, the planner bisects its year range
+    until each slice reports no more than that, then retrieves the
+    slices and yields their articles as one stream, without duplicate
+    articles.
+
+    Probing a slice's result count retrieves the slice's first results
+    page, which then counts toward its harvest, so a slice that needs
+    no further splitting costs no extra request. Several threads probe
+    and retrieve slices in parallel, all sharing the given querier.
+
+    A slice narrowed down to a single year that still reports too many
+    results gets retrieved only up to the reachable limit. Note also
+    that once the query gets split, articles without a publication
+    year are missed, since no year range includes them.
+    """
+    _DONE = object() # Marks the end of a worker's output
+
+    def __init__(self, querier, reachable=None, workers=None,
+                 first_year=None, last_year=None):
+        self.querier = querier
+        self.reachable = reachable or ScholarConf.PLAN_REACHABLE_RESULTS
+        self.workers = max(1, workers or ScholarConf.PLAN_WORKERS)
+        self.first_year = first_year or ScholarConf.PLAN_FIRST_YEAR
+        self.last_year = last_year or time.localtime().tm_year
+
+        self.query = None
+        self.slices = [] # (first year, last year, num_results) per slice
+        self.probes = 0
+        self._tasks = []
+        self._inflight = 0
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._results = queue.Queue()
+
+    def run(self, query, limit=None):
+        """
+        This generator plans and retrieves the given SearchScholarQuery,
+        yielding the resulting ScholarArticle instances as their slices
+        come in. Retrieval stops after `limit` articles, or when the
+        generator gets closed. The query's num_results attribute
+        reflects the total Scholar reports for the unsplit query.
+        """
+        if not isinstance(query, SearchScholarQuery):
+            raise QueryArgumentError('only search queries can be split by year')
+
+        self.query = query
+        self.slices = []
+        self.probes = 0
+        self._tasks = [None] # The query as given, unless it's too broad
+        self._stopped = False
+
+        threads = []
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        seen = set()
+        count = 0
+        try:
+            done = 0
+            while done < len(threads) and (limit is None or count < limit):
+                art = self._results.get()
+                if art is self._DONE:
+                    done += 1
+                    continue
+                key = ScholarArticleStore.get_key(art)
+                if key is not None:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                count += 1
+                yield art
+        finally:
+            with self._cond:
+                self._stopped = True
+                self._cond.notify_all()
+            for thread in threads:
+                thread.join()
+
+        ScholarUtils.log('info', 'plan done: %d slices after %d probes, %d articles',
+                         len(self.slices), self.probes, count)
+
+    def _worker(self):
         try:
-            ScholarUtils.log('info', 'requesting %s' % unquote(url))
+            while True:
+                with self._cond:
+                    while not self._tasks and self._inflight and not self._stopped:
+                        self._cond.wait()
+                    if not self._tasks or self._stopped:
+                        return
+                    years = self._tasks.pop(0)
+                    self._inflight += 1
 
-            req = Request(url=url, headers={'User-Agent': ScholarConf.USER_AGENT})
-            hdl = self.opener.open(req)
-            html = hdl.read()
+                try:
+                    self._harvest(years)
+                except Exception as err:
+                    ScholarUtils.log('warn', 'retrieving slice %s failed: %s',
+                                     self._describe(years), err)
+
+                with self._cond:
+                    self._inflight -= 1
+                    self._cond.notify_all()
+        finally:
+            self._results.put(self._DONE)
+
+    def _harvest(self, years):
+        """
+        Probes the given slice of years (None for the unsplit query),
+        and either splits it or retrieves its results.
+        """
+        query = copy.deepcopy(self.query)
+        if years is not None:
+            query.set_timeframe(*years)
+        page_size = query.num_results or ScholarConf.MAX_PAGE_RESULTS
+        query.set_num_page_results(page_size)
+        query.set_start(0)
+
+        result = self.querier.search(query)
+        num_results = result['num_results'] or len(result.articles)
+        with self._cond:
+            self.probes += 1
+        if years is None:
+            self.query['num_results'] = num_results
+
+        if num_results > self.reachable:
+            if years is None:
+                years = (self.query.timeframe[0] or self.first_year,
+                         self.query.timeframe[1] or self.last_year)
+            if years[0] < years[1]:
+                mid = (years[0] + years[1]) // 2
+                ScholarUtils.log('info', '%s reports %d results, splitting',
+                                 self._describe(years), num_results)
+                with self._cond:
+                    self._tasks.extend([(years[0], mid), (mid + 1, years[1])])
+                return
+            ScholarUtils.log('warn', '%s reports %d results, retrieving only %d',
+                             self._describe(years), num_results, self.reachable)
+
+        with self._cond:
+            self.slices.append((years or tuple(self.query.timeframe)) + (num_results,))
+
+        for art in result.articles:
+            self._results.put(art)
+
+        limit = min(num_results, self.reachable) - page_size
+        if len(result.articles) < page_size or limit <= 0:
+            return
 
-            ScholarUtils.log('debug', log_msg)
-            ScholarUtils.log('debug', '>>>>' + '-'*68)
-            ScholarUtils.log('debug', 'url: %s' % hdl.geturl())
-            ScholarUtils.log('debug', 'result: %s' % hdl.getcode())
-            ScholarUtils.log('debug', 'headers:\n' + str(hdl.info()))
-            ScholarUtils.log('debug', 'data:\n' + html.decode('utf-8')) # For Python 3
-            ScholarUtils.log('debug', '<<<<' + '-'*68)
+        query.set_start(page_size)
+        for art in self.querier.iter_results(query, limit=limit):
+            if self._stopped:
+                return
+            self._results.put(art)
 
-            return html
-        except Exception as err:
-            ScholarUtils.log('info', err_msg + ': %s' % err)
-            return None
+    @staticmethod
+    def _describe(years):
+        if years is None:
+            return 'query'
+        return 'years %s-%s' % (years[0] or '', years[1] or '')
+
+
+def make_query(args):
+    """
+    Returns a ScholarQuery instance configured from the given dictionary
+    of query arguments. The keys are those of the command-line query
+    options (see main()), e.g. 'author', 'allw', or 'cluster_id'.
+    Raises QueryArgumentError for contradicting arguments.
+    """
+    def arg(key):
+        return args.get(key) or None
+
+    if arg('cluster_id') is not None:
+        # If the arguments include a cluster ID query, it makes no
+        # sense to have search arguments:
+        for key in ('author', 'allw', 'some', 'none', 'phrase', 'title_only',
+                    'pub', 'after', 'before'):
+            if arg(key):
+                raise QueryArgumentError('Cluster ID queries do not allow '
+                                         'additional search arguments.')
+        query = ClusterScholarQuery(cluster=arg('cluster_id'))
+    else:
+        query = SearchScholarQuery()
+        if arg('author'):
+            query.set_author(arg('author'))
+        if arg('allw'):
+            query.set_words(arg('allw'))
+        if arg('some'):
+            query.set_words_some(arg('some'))
+        if arg('none'):
+            query.set_words_none(arg('none'))
+        if arg('phrase'):
+            query.set_phrase(arg('phrase'))
+        if arg('title_only'):
+            query.set_scope(True)
+        if arg('pub'):
+            query.set_pub(arg('pub'))
+        if arg('after') or arg('before'):
+            query.set_timeframe(arg('after'), arg('before'))
+        if arg('no_patents'):
+            query.set_include_patents(False)
+        if arg('no_citations'):
+            query.set_include_citations(False)
+
+    if arg('count') is not None:
+        count = ScholarUtils.ensure_int(arg('count'), 'count must be numeric')
+        query.set_num_page_results(min(count, ScholarConf.MAX_PAGE_RESULTS))
+
+    return query
+
+def read_batch(batch_file):
+    """
+    A generator yielding dictionaries of query arguments (as understood
+    by make_query()) from the given file. Files ending in .csv are read
+    as CSV with a header line naming the arguments, anything else as
+    JSONL, i.e. one JSON object per line. Malformed JSONL lines get
+    logged and skipped. Flags given as text, e.g. "false", get converted
+    to booleans in either format.
+    """
+    true_vals = ('1', 'true', 'yes', 'y')
+    flags = ('title_only', 'no_patents', 'no_citations')
+
+    def convert_flags(args):
+        for flag in flags:
+            if flag in args:
+                args[flag] = unicode(args[flag]).strip().lower() in true_vals
+        return args
+
+    with open(batch_file) as hdl:
+        if batch_file.lower().endswith('.csv'):
+            for row in csvlib.DictReader(hdl):
+                args = dict((key.strip(), val.strip())
+                            for key, val in row.items()
+                            if key is not None and val)
+                yield convert_flags(args)
+        else:
+            for num, line in enumerate(hdl, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    args = json.loads(line)
+                except ValueError as err:
+                    ScholarUtils.log('warn', 'skipping batch line %d: %s', num, err)
+                    continue
+                if not isinstance(args, dict):
+                    ScholarUtils.log('warn', 'skipping batch line %d: not a JSON object', num)
+                    continue
+                yield convert_flags(args)
+
+def read_cluster_ids(path):
+    """
+    A generator yielding the cluster IDs listed in the given file, one
+    per line. Blank lines and lines starting with "#" are skipped.
+    """
+    with open(path) as hdl:
+        for line in hdl:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+def get_parser_class(name):
+    """
+    Returns the results page parser class of the given name, e.g.
+    "ScholarArticleParser120726". Raises FormatError if there's none.
+    """
+    parser_class = globals().get(name)
+    if not isinstance(parser_class, type) \
+       or not issubclass(parser_class, ScholarArticleParser):
+        raise FormatError('no parser class "%s"' % name)
+    return parser_class
+
+def _parse_page(job):
+    """
+    Helper for ScholarParserPool, parses a results page in a worker
+    process and returns the parser's callbacks as a list of (event,
+    value) tuples.
+    """
+    html, parser_name, engine = job
+    events = []
+    parser = get_parser_class(parser_name)(engine=engine)
+    parser.handle_num_results = lambda num: events.append(
+        (ScholarParserPool.EVENT_NUM_RESULTS, num))
+    parser.handle_article = lambda art: events.append(
+        (ScholarParserPool.EVENT_ARTICLE, art))
+    parser.parse(html)
+    return events
+
+def _reparse_page(job):
+    """
+    Helper for reparse(), parses an archived results page in a worker
+    process and returns the resulting articles.
+    """
+    path, parser_name, engine = job
+    with gzip.open(path, 'rb') as hdl:
+        events = _parse_page((hdl.read(), parser_name, engine))
+    return [value for event, value in events
+            if event == ScholarParserPool.EVENT_ARTICLE]
+
+def reparse(archive_dir, parser_name='ScholarArticleParser120726', processes=None):
+    """
+    A generator yielding the articles found in the results pages of the
+    given response archive (see ScholarArchive), as parsed by the
+    parser class of the given name, without any network access. Each
+    distinct page gets parsed once, in order of first retrieval, using
+    a pool of worker processes, by default one per CPU. Raises
+    FormatError if the directory holds no archive.
+    """
+    get_parser_class(parser_name) # Fail early on unknown parsers.
+    # ScholarArchive would create a missing archive, hiding typos:
+    if not os.path.isfile(os.path.join(archive_dir, ScholarArchive.DB_FILE)):
+        raise FormatError('no response archive in "%s"' % archive_dir)
+
+    archive = ScholarArchive(archive_dir)
+    jobs, digests = [], set()
+    for _, _, _, digest in archive.get_entries(ScholarCache.KIND_RESULTS):
+        if digest not in digests:
+            digests.add(digest)
+            jobs.append((archive.get_path(digest), parser_name,
+                         ScholarConf.PARSER_ENGINE))
+    archive.close()
+    ScholarUtils.log('info', 're-parsing %d archived results pages', len(jobs))
+
+    if processes == 1 or len(jobs) < 2 or not futures.is_available():
+        for job in jobs:
+            for art in _reparse_page(job):
+                yield art
+        return
+
+    with futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        for articles in pool.map(_reparse_page, jobs, chunksize=4):
+            for art in articles:
+                yield art
+
+def batch(querier, batch_file, output=None):
+    """
+    Runs every query listed in the given batch file (see read_batch())
+    through the given querier, writing each resulting article as a
+    JSON object on a line of its own, together with the originating
+    query arguments, to the given ScholarOutput (stdout by default).
+    When the querier parses in worker processes, the next query runs
+    while the previous one's pages parse; output remains in the order
+    of the batch file.
+    """
+    output = output or ScholarOutput()
+    executor = None
+    if querier.parse_pool is not None:
+        # The querier is safe to share across threads:
+        executor = futures.ThreadPoolExecutor(max_workers=2)
+    try:
+        pending = []
+        for args in read_batch(batch_file):
+            if executor is None:
+                _write_batch_results(output, args, _run_batch_query(querier, args))
+                continue
+            pending.append((args, executor.submit(_run_batch_query, querier, args)))
+            if len(pending) > 1:
+                done_args, future = pending.pop(0)
+                _write_batch_results(output, done_args, future.result())
+        for done_args, future in pending:
+            _write_batch_results(output, done_args, future.result())
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        # Keep the output of the queries done so far:
+        output.close()
+
+def _run_batch_query(querier, args):
+    """
+    Helper for batch(), returns the articles resulting from the query
+    given by its arguments, or an empty list for invalid queries.
+    """
+    try:
+        query = make_query(args)
+        limit = ScholarConf.MAX_PAGE_RESULTS
+        if args.get('count'):
+            limit = ScholarUtils.ensure_int(args['count'], 'count must be numeric')
+        return list(querier.iter_results(query, limit=limit))
+    except Error as err:
+        ScholarUtils.log('warn', 'skipping batch query %s: %s', args, err)
+        return []
+
+def _write_batch_results(output, args, articles):
+    """Helper for batch(), writes a query's articles."""
+    for art in articles:
+        output.write(json.dumps({'query': args, 'article': art.as_dict()},
+                                sort_keys=True) + '\n')
+
+class ScholarOutput(object):
+    """
+    A buffered output sink for rendered articles. It writes to stdout
+    by default, or to a file, which gets gzip-compressed if its name
+    ends in ".gz". Records are buffered and written out in chunks of
+    flush_every records, or individually when writing to a terminal.
+    """
+    def __init__(self, path=None, flush_every=None, append=False):
+        self.path = path
+        self._to_stdout = path is None or path == '-'
+        mode = 'ab' if append else 'wb'
+        if self._to_stdout:
+            # Python 3's stdout expects text, its buffer takes bytes:
+            self._hdl = getattr(sys.stdout, 'buffer', sys.stdout)
+        elif path.endswith('.gz'):
+            self._hdl = gzip.open(path, mode)
+        else:
+            self._hdl = open(path, mode)
+
+        if flush_every is None:
+            flush_every = ScholarConf.OUTPUT_FLUSH_EVERY
+            if self._to_stdout and sys.stdout.isatty():
+                flush_every = 1
+        self.flush_every = max(1, flush_every)
+        self._buf = []
+        self._records = 0
+
+    def write(self, text, record=True):
+        """
+        Buffers the given text. If record is True, the text completes
+        a record, which may cause the buffer to get flushed.
+        """
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        self._buf.append(text)
+        if record:
+            self._records += 1
+            if self._records >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        if self._to_stdout:
+            sys.stdout.flush() # Anything printed directly goes first.
+        if self._buf:
+            self._hdl.write(b''.join(self._buf))
+        self._hdl.flush()
+        self._buf = []
+        self._records = 0
+
+    def close(self):
+        self.flush()
+        if not self._to_stdout:
+            self._hdl.close()
+
+
+class ScholarWriter(object):
+    """
+    The base class for writers rendering articles into a ScholarOutput
+    instance as they arrive. Derived classes implement write().
+    """
+    def __init__(self, output=None):
+        self.output = output or ScholarOutput()
+
+    def write_globals(self, query, first=None):
+        """
+        Renders the global results of the given query, given the first
+        article of the results, if any. Does nothing by default.
+        """
+
+    def write(self, art):
+        raise NotImplementedError()
+
+    def write_all(self, articles):
+        for art in articles:
+            self.write(art)
 
+    def close(self):
+        self.output.close()
 
-def txt(querier, with_globals):
-    if with_globals:
+
+class ScholarTxtWriter(ScholarWriter):
+    """Renders articles in the format of ScholarArticle.as_txt()."""
+
+    # Standard attribute keys and their label prefixes, as rendered
+    # by ScholarArticle.as_txt():
+    FIELDS = [(field[0], '%*s ' % (ScholarArticle.MAX_LABEL_LEN, field[1]))
+              for field in ScholarArticle.FIELDS]
+
+    def write_globals(self, query, first=None):
         # If we have any articles, check their attribute labels to get
         # the maximum length -- makes for nicer alignment.
         max_label_len = 0
-        if len(querier.articles) > 0:
-            items = sorted(list(querier.articles[0].attrs.values()),
-                           key=lambda item: item[2])
-            max_label_len = max([len(str(item[1])) for item in items])
+        if first is not None:
+            max_label_len = max([len(str(item[1]))
+                                 for item in first.labeled_items()])
 
         # Get items sorted in specified order:
-        items = sorted(list(querier.query.attrs.values()), key=lambda item: item[2])
+        items = sorted(list(query.attrs.values()), key=lambda item: item[2])
         # Find largest label length:
         max_label_len = max([len(str(item[1])) for item in items] + [max_label_len])
-        fmt = '[G] %%%ds %%s' % max(0, max_label_len-4)
+        fmt = '[G] %%%ds %%s\n' % max(0, max_label_len-4)
         for item in items:
             if item[0] is not None:
-                print(fmt % (item[1], item[0]))
-        if len(items) > 0:
-            print
+                self.output.write(fmt % (item[1], item[0]), record=False)
 
-    articles = querier.articles
-    for art in articles:
-        print(encode(art.as_txt()) + '\n')
+    def write(self, art):
+        if not art.is_standard():
+            self.output.write(art.as_txt() + '\n\n')
+            return
+        res = []
+        for key, prefix in self.FIELDS:
+            val = getattr(art, key)
+            if val is not None:
+                res.append(prefix + unicode(val))
+        res.append('\n')
+        self.output.write('\n'.join(res))
 
-def csv(querier, header=False, sep='|'):
-    articles = querier.articles
-    for art in articles:
-        result = art.as_csv(header=header, sep=sep)
-        print(encode(result))
-        header = False
 
-def citation_export(querier):
-    articles = querier.articles
-    for art in articles:
-        print(art.as_citation() + '\n')
+class ScholarCsvWriter(ScholarWriter):
+    """
+    Renders articles in the format of ScholarArticle.as_csv(), with an
+    optional header line preceding the first article.
+    """
+    def __init__(self, output=None, header=False, sep='|'):
+        ScholarWriter.__init__(self, output)
+        self.header = header
+        self.sep = sep
+        self.header_line = sep.join(ScholarArticle.KEYS) + '\n'
+
+    def write(self, art):
+        if not art.is_standard():
+            self.output.write(art.as_csv(header=self.header, sep=self.sep) + '\n')
+        else:
+            if self.header:
+                self.output.write(self.header_line, record=False)
+            self.output.write(self.sep.join([unicode(getattr(art, key))
+                                             for key in ScholarArticle.KEYS]) + '\n')
+        self.header = False
+
+
+class ScholarCitationWriter(ScholarWriter):
+    """Renders articles in their citation export format."""
+
+    def write(self, art):
+        data = art.as_citation()
+        if isinstance(data, bytes):
+            data = data.decode('utf-8', 'replace')
+        self.output.write(data + '\n\n')
+
+
+class ScholarJsonWriter(ScholarWriter):
+    """
+    Renders articles as JSON objects, one per line, with typed fields
+    as provided by ScholarArticle.as_record().
+    """
+    def write(self, art):
+        self.output.write(json.dumps(art.as_record()) + '\n')
+
+
+class ScholarArrowWriter(ScholarWriter):
+    """
+    Writes articles to a columnar file, in Parquet format or, if the
+    file name ends in .arrow or .feather, in Arrow IPC file format.
+    Columns are the standard article attributes plus the citation
+    data, typed as in ScholarArticle.as_record(); other attributes are
+    not written. Requires the pyarrow package.
+    """
+    IPC_SUFFIXES = ('.arrow', '.feather')
+
+    def __init__(self, path, batch_rows=None):
+        if not pyarrow_parquet.is_available():
+            raise FormatError('columnar output requires the pyarrow package')
+        self.output = None # We write to the file directly.
+        self.batch_rows = max(1, batch_rows or ScholarConf.COLUMNAR_BATCH_ROWS)
+        self.columns = ScholarArticle.KEYS + ('citation_data',)
+        self.schema = pyarrow.schema(
+            [(key, pyarrow.int64() if key in ScholarArticle.INT_KEYS
+              else pyarrow.string()) for key in self.columns])
+        if path.lower().endswith(self.IPC_SUFFIXES):
+            self._writer = pyarrow_ipc.new_file(path, self.schema)
+        else:
+            self._writer = pyarrow_parquet.ParquetWriter(path, self.schema)
+        self._batch = dict((key, []) for key in self.columns)
+        self._rows = 0
+
+    def write(self, art):
+        rec = art.as_record()
+        for key in self.columns:
+            val = rec.get(key)
+            if val is not None and key not in ScholarArticle.INT_KEYS:
+                val = unicode(val)
+            self._batch[key].append(val)
+        self._rows += 1
+        if self._rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        """Writes out the buffered rows as a record batch."""
+        if self._rows == 0:
+            return
+        self._writer.write_table(pyarrow.Table.from_pydict(self._batch, self.schema))
+        self._batch = dict((key, []) for key in self.columns)
+        self._rows = 0
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+
+def txt(querier, with_globals, articles=None, output=None, query=None):
+    if articles is None:
+        articles = querier.articles
+    if query is None and querier is not None:
+        query = querier.query
+    articles = iter(articles)
+    writer = ScholarTxtWriter(output)
+
+    if with_globals and query is not None:
+        # Global results are known only once the first results page
+        # got parsed, so pull in the first article before rendering.
+        first = next(articles, None)
+        if first is not None:
+            articles = itertools.chain([first], articles)
+        writer.write_globals(query, first)
+
+    writer.write_all(articles)
+    writer.close()
+
+def csv(querier, header=False, sep='|', articles=None, output=None):
+    if articles is None:
+        articles = querier.articles
+    writer = ScholarCsvWriter(output, header=header, sep=sep)
+    writer.write_all(articles)
+    writer.close()
+
+def jsonl(querier, articles=None, output=None):
+    if articles is None:
+        articles = querier.articles
+    writer = ScholarJsonWriter(output)
+    writer.write_all(articles)
+    writer.close()
+
+def columnar(querier, path, articles=None):
+    if articles is None:
+        articles = querier.articles
+    writer = ScholarArrowWriter(path)
+    try:
+        writer.write_all(articles)
+    finally:
+        writer.close()
+
+def citation_export(querier, articles=None, output=None):
+    if articles is None:
+        articles = querier.articles
+    writer = ScholarCitationWriter(output)
+    writer.write_all(articles)
+    writer.close()
+
+
+def _render(options, querier, articles, output, query=None):
+    """
+    Helper for main(), writes the given articles in the format selected
+    by the command-line options. Global results get rendered for the
+    given query, if any.
+    """
+    if options.columnar:
+        columnar(querier, options.output, articles=articles)
+    elif options.jsonl:
+        jsonl(querier, articles=articles, output=output)
+    elif options.csv:
+        csv(querier, articles=articles, output=output)
+    elif options.csv_header:
+        csv(querier, header=True, articles=articles, output=output)
+    elif options.citation is not None:
+        citation_export(querier, articles=articles, output=output)
+    else:
+        txt(querier, with_globals=options.txt_globals and querier is not None,
+            articles=articles, output=output, query=query)
+
+def _finish(options, querier):
+    """
+    Helper for main(), saves the querier's state, releases its
+    resources, and reports its metrics as requested.
+    """
+    if options.cookie_file:
+        querier.save_cookies()
+    querier.close()
 
+    metrics = querier.get_metrics()
+    if options.stats:
+        sys.stderr.write('Statistics:\n%s\n' % metrics.as_txt())
+    if options.stats_file:
+        metrics.save(options.stats_file)
+    ScholarUtils.log('info', 'request counters: %s',
+                     querier.scheduler.get_counters())
 
 def main():
     usage = """scholar.py [options] <query string>
@@ -1190,7 +4561,9 @@ scholar.py -c 5 -a "albert einstein" -t --none "quantum theory" --after 1970"""
     group.add_option('-C', '--cluster-id', metavar='CLUSTER_ID', default=None,
                      help='Do not search, just use articles in given cluster ID')
     group.add_option('-c', '--count', type='int', default=None,
-                     help='Maximum number of results')
+                     help='Maximum number of results. Counts beyond %d are retrieved across several results pages.' % ScholarConf.MAX_PAGE_RESULTS)
+    group.add_option('--count-only', action='store_true', default=False,
+                     help='Only print the total number of results Scholar reports for the query. This retrieves as little as possible, and with --cache-dir caches counts per query.')
     parser.add_option_group(group)
 
     group = optparse.OptionGroup(parser, 'Output format',
@@ -1203,13 +4576,68 @@ scholar.py -c 5 -a "albert einstein" -t --none "quantum theory" --after 1970"""
                      help='Print article data in CSV form (separator is "|")')
     group.add_option('--csv-header', action='store_true',
                      help='Like --csv, but print header with column names')
+    group.add_option('--jsonl', action='store_true', default=False,
+                     help='Print article data as JSON objects, one per line, with numeric fields as numbers')
+    group.add_option('--columnar', action='store_true', default=False,
+                     help='Write article data to the --output file in Parquet format, or Arrow IPC format if the file name ends in .arrow or .feather. Requires pyarrow.')
+    group.add_option('--batch', metavar='FILE', default=None,
+                     help='Run all queries listed in FILE and print the resulting articles as JSON objects, one per line, tagged with their query. FILE contains one JSON object per line, or CSV with a header if its name ends in .csv. Keys are the long names of the query options above, with dashes turned into underscores, e.g. "author" or "cluster_id", and "allw" for --all.')
+    group.add_option('--watch', metavar='FILE', default=None,
+                     help='Refresh the citation counts of the clusters whose IDs FILE lists, one per line, and print only the clusters that changed. Known counts are kept in FILE.sqlite.')
+    group.add_option('--watch-budget', metavar='N', type='int', default=None,
+                     help='Spend at most N requests per watch run, refreshing the most active clusters first (default: %d)' % ScholarConf.WATCH_BUDGET)
+    group.add_option('--crawl', metavar='DEPTH', type='int', default=None,
+                     help='Crawl the citation graph up to DEPTH citation hops away from the query results, printing one line per citation: the citing and the cited article\'s cluster IDs, separated by a tab.')
+    group.add_option('--crawl-max-nodes', metavar='N', type='int', default=None,
+                     help='Expand at most N articles per crawl (default: %d)' % ScholarConf.CRAWL_MAX_NODES)
+    group.add_option('--crawl-workers', metavar='N', type='int', default=None,
+                     help='Expand up to N articles in parallel, subject to the request rate limit (default: %d)' % ScholarConf.CRAWL_WORKERS)
+    group.add_option('--checkpoint', metavar='FILE', default=None,
+                     help='Save crawl progress to FILE. If FILE exists, resume the crawl it records, appending to the output.')
+    group.add_option('--plan', action='store_true', default=False,
+                     help='Retrieve all results of the search query, up to --count if given. Queries reporting more than %d results get split into year ranges retrieved separately, skipping articles without a year.' % ScholarConf.PLAN_REACHABLE_RESULTS)
+    group.add_option('--plan-workers', metavar='N', type='int', default=None,
+                     help='Retrieve up to N year ranges in parallel, subject to the request rate limit (default: %d)' % ScholarConf.PLAN_WORKERS)
+    group.add_option('-o', '--output', metavar='FILE', default=None,
+                     help='Write results to FILE instead of stdout. FILE gets gzip-compressed if its name ends in ".gz".')
+    group.add_option('--flush-every', metavar='N', type='int', default=None,
+                     help='Write out results in chunks of N articles (default: %d, or 1 on a terminal)' % ScholarConf.OUTPUT_FLUSH_EVERY)
     group.add_option('--citation', metavar='FORMAT', default=None,
                      help='Print article details in standard citation format. Argument Must be one of "bt" (BibTeX), "en" (EndNote), "rm" (RefMan), or "rw" (RefWorks).')
     parser.add_option_group(group)
 
     group = optparse.OptionGroup(parser, 'Miscellaneous')
+    group.add_option('--parser-engine', metavar='ENGINE', default=None,
+                     choices=list(SoupKitchen.ENGINES),
+                     help='Parser engine for results pages, one of %s (default: %s). The lxml engine is faster but requires the lxml package.' % (', '.join(['"%s"' % engine for engine in SoupKitchen.ENGINES]), ScholarConf.PARSER_ENGINE))
     group.add_option('--cookie-file', metavar='FILE', default=None,
                      help='File to use for cookie storage. If given, will read any existing cookies if found at startup, and save resulting cookies in the end.')
+    group.add_option('--cache-dir', metavar='DIR', default=None,
+                     help='Directory in which to cache HTTP responses across invocations. Cached responses skip the network entirely.')
+    group.add_option('--cache-ttl', metavar='SECONDS', type='int', default=None,
+                     help='Time after which cached results pages expire (default: %d)' % ScholarConf.CACHE_TTL)
+    group.add_option('--cache-citation-ttl', metavar='SECONDS', type='int', default=None,
+                     help='Time after which cached citation exports expire (default: %d)' % ScholarConf.CACHE_CITATION_TTL)
+    group.add_option('--archive', metavar='DIR', default=None,
+                     help='Archive all raw HTTP responses in DIR, for later use with --reparse.')
+    group.add_option('--reparse', metavar='DIR', default=None,
+                     help='Instead of querying Scholar, parse the results pages archived in DIR (see --archive) and print the resulting articles.')
+    group.add_option('--reparse-parser', metavar='CLASS', default='ScholarArticleParser120726',
+                     help='Parser class to use with --reparse (default: %default)')
+    group.add_option('--parse-processes', metavar='N', type='int', default=None,
+                     help='Parse results pages in N worker processes, which speeds up crawls with several workers (default: parse in-process)')
+    group.add_option('--processes', metavar='N', type='int', default=None,
+                     help='Number of processes parsing pages in parallel with --reparse (default: one per CPU)')
+    group.add_option('--store', metavar='FILE', default=None,
+                     help='Record all articles seen in SQLite database FILE, merging repeat sightings. Citation exports found there are not retrieved again.')
+    group.add_option('--pool-size', metavar='N', type='int', default=None,
+                     help='Number of idle persistent connections to keep per host (default: %d)' % ScholarConf.HTTP_POOL_SIZE)
+    group.add_option('--no-keepalive', action='store_true', default=False,
+                     help='Use a new connection for every request')
+    group.add_option('--stats', action='store_true', default=False,
+                     help='Print request, cache and parsing statistics to stderr when done')
+    group.add_option('--stats-file', metavar='FILE', default=None,
+                     help='Write request, cache and parsing statistics to FILE when done: as JSON if FILE ends in .json, in Prometheus text format otherwise')
     group.add_option('-d', '--debug', action='count', default=0,
                      help='Enable verbose logging to stderr. Repeated options increase detail of debug output.')
     group.add_option('-v', '--version', action='store_true', default=False,
@@ -1226,7 +4654,7 @@ scholar.py -c 5 -a "albert einstein" -t --none "quantum theory" --after 1970"""
     if options.debug > 0:
         options.debug = min(options.debug, ScholarUtils.LOG_LEVELS['debug'])
         ScholarConf.LOG_LEVEL = options.debug
-        ScholarUtils.log('info', 'using log level %d' % ScholarConf.LOG_LEVEL)
+        ScholarUtils.log('info', 'using log level %d', ScholarConf.LOG_LEVEL)
 
     if options.version:
         print('This is scholar.py %s.' % ScholarConf.VERSION)
@@ -1234,14 +4662,66 @@ scholar.py -c 5 -a "albert einstein" -t --none "quantum theory" --after 1970"""
 
     if options.cookie_file:
         ScholarConf.COOKIE_JAR_FILE = options.cookie_file
+    if options.parser_engine:
+        ScholarConf.PARSER_ENGINE = SoupKitchen.get_engine(options.parser_engine)
+    if options.cache_dir:
+        ScholarConf.CACHE_DIR = options.cache_dir
+    if options.cache_ttl is not None:
+        ScholarConf.CACHE_TTL = options.cache_ttl
+    if options.cache_citation_ttl is not None:
+        ScholarConf.CACHE_CITATION_TTL = options.cache_citation_ttl
+    if options.store:
+        ScholarConf.STORE_FILE = options.store
+    if options.archive:
+        ScholarConf.ARCHIVE_DIR = options.archive
+    if options.parse_processes is not None:
+        ScholarConf.PARSE_PROCESSES = options.parse_processes
+    if options.pool_size is not None:
+        ScholarConf.HTTP_POOL_SIZE = options.pool_size
+    if options.no_keepalive:
+        ScholarConf.HTTP_KEEPALIVE = False
+
+    if options.columnar:
+        if options.output is None or options.output == '-':
+            print('Columnar output requires an output file, see --output.')
+            return 1
+        if not pyarrow_parquet.is_available():
+            print('Columnar output requires the pyarrow package, sorry...')
+            return 1
+        if options.batch or options.crawl is not None:
+            print('Columnar output does not support batch or crawl mode.')
+            return 1
+
+    if options.count_only and (options.batch or options.watch or options.plan
+                               or options.crawl is not None or options.columnar):
+        print('Count-only mode works only for individual queries.')
+        return 1
+
+    if options.plan and (options.batch or options.watch or options.crawl is not None
+                         or options.cluster_id):
+        print('Query plans work only for search queries.')
+        return 1
+
+    if options.reparse:
+        # Re-parsing archived responses needs neither querier nor network:
+        output = None
+        if not options.columnar:
+            output = ScholarOutput(options.output, options.flush_every)
+        try:
+            articles = reparse(options.reparse, options.reparse_parser,
+                               options.processes)
+            _render(options, None, articles, output)
+        except Error as err:
+            print(err)
+            return 1
+        return 0
 
-    # Sanity-check the options: if they include a cluster ID query, it
-    # makes no sense to have search arguments:
-    if options.cluster_id is not None:
-        if options.author or options.allw or options.some or options.none \
-           or options.phrase or options.title_only or options.pub \
-           or options.after or options.before:
-            print('Cluster ID queries do not allow additional search arguments.')
+    query = None
+    if not options.batch and not options.watch:
+        try:
+            query = make_query(vars(options))
+        except Error as err:
+            print(err)
             return 1
 
     querier = ScholarQuerier()
@@ -1261,49 +4741,66 @@ scholar.py -c 5 -a "albert einstein" -t --none "quantum theory" --after 1970"""
 
     querier.apply_settings(settings)
 
-    if options.cluster_id:
-        query = ClusterScholarQuery(cluster=options.cluster_id)
-    else:
-        query = SearchScholarQuery()
-        if options.author:
-            query.set_author(options.author)
-        if options.allw:
-            query.set_words(options.allw)
-        if options.some:
-            query.set_words_some(options.some)
-        if options.none:
-            query.set_words_none(options.none)
-        if options.phrase:
-            query.set_phrase(options.phrase)
-        if options.title_only:
-            query.set_scope(True)
-        if options.pub:
-            query.set_pub(options.pub)
-        if options.after or options.before:
-            query.set_timeframe(options.after, options.before)
-        if options.no_patents:
-            query.set_include_patents(False)
-        if options.no_citations:
-            query.set_include_citations(False)
-
-    if options.count is not None:
-        options.count = min(options.count, ScholarConf.MAX_PAGE_RESULTS)
-        query.set_num_page_results(options.count)
+    # A resumed crawl continues the edge list of the interrupted one:
+    resume = options.crawl is not None and options.checkpoint is not None \
+        and os.path.exists(options.checkpoint)
+    output = None
+    if not options.columnar:
+        output = ScholarOutput(options.output, options.flush_every, append=resume)
+
+    if options.batch:
+        # All batch queries share the querier, and with it the
+        # connection state, cookies and applied settings:
+        batch(querier, options.batch, output)
+        _finish(options, querier)
+        return 0
 
-    querier.send_query(query)
+    if options.crawl is not None:
+        crawler = ScholarCrawler(querier, output, depth=options.crawl,
+                                 max_nodes=options.crawl_max_nodes,
+                                 workers=options.crawl_workers,
+                                 checkpoint=options.checkpoint)
+        if not crawler.resume():
+            crawler.add_seeds(querier.iter_results(
+                query, limit=options.count or ScholarConf.MAX_PAGE_RESULTS))
+        crawler.run()
+        output.close()
+        _finish(options, querier)
+        return 0
 
-    if options.csv:
-        csv(querier)
-    elif options.csv_header:
-        csv(querier, header=True)
-    elif options.citation is not None:
-        citation_export(querier)
+    if options.count_only:
+        num_results = querier.get_num_results(query)
+        if num_results is not None:
+            output.write('%d\n' % num_results)
+        output.close()
+        _finish(options, querier)
+        return 0 if num_results is not None else 1
+
+    watcher = None
+    if options.watch:
+        # Watch mode reports only the clusters whose counts changed:
+        watcher = ScholarWatcher(querier, options.watch + '.sqlite',
+                                 options.watch_budget)
+        watcher.add(read_cluster_ids(options.watch))
+        articles = watcher.refresh()
+    elif options.plan:
+        planner = ScholarQueryPlanner(querier, workers=options.plan_workers)
+        articles = planner.run(query, limit=options.count)
     else:
-        txt(querier, with_globals=options.txt_globals)
+        # Without an explicit count we report only the first results
+        # page, as Scholar renders it by default.
+        limit = options.count
+        if limit is None:
+            limit = ScholarConf.MAX_PAGE_RESULTS
 
-    if options.cookie_file:
-        querier.save_cookies()
+        # Articles get rendered as soon as their results page is parsed:
+        articles = querier.iter_results(query, limit=limit)
+
+    _render(options, querier, articles, output, query)
 
+    if watcher is not None:
+        watcher.close()
+    _finish(options, querier)
     return 0
 
 if __name__ == "__main__":
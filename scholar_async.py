@@ -0,0 +1,440 @@
+#! /usr/bin/env python3
+"""
+This module provides an asyncio-native variant of scholar.py's
+ScholarQuerier. It lives in a separate module because coroutines
+require Python 3.6+, while scholar.py itself still runs on Python 2.
+
+The querier performs its HTTP traffic through a pluggable transport
+object. The default transport speaks HTTP directly over asyncio
+streams, so no threads get tied up while requests are in flight. For
+testing, any object providing a send() coroutine can be used instead,
+for example one talking to a local stub server.
+"""
+# Don't complain about missing docstrings: pylint: disable-msg=C0111
+#
+# Copyright 2010--2017 Christian Kreibich. All rights reserved.
+#
+# See scholar.py for licensing details.
+
+import asyncio
+import copy
+import io
+import ssl
+import time
+
+from http.client import parse_headers
+from urllib.parse import unquote, urljoin, urlsplit
+from urllib.request import Request
+
+from scholar import ScholarCache, ScholarConf, ScholarQuerier, \
+    ScholarRequestScheduler, ScholarResult, ScholarUtils, ThrottledError
+
+
+class AsyncResponse(object):
+    """
+    A fully read HTTP response, as returned by transports. It provides
+    the minimal interface http.cookiejar requires to extract cookies.
+    """
+    def __init__(self, url, code, headers, body):
+        self.url = url
+        self.code = code
+        self.headers = headers
+        self.body = body
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.code
+
+
+class AsyncTransport(object):
+    """
+    The base class for transports used by AsyncScholarQuerier. The
+    querier takes care of cookies and redirects, so a transport only
+    needs to deliver a single request and return its response.
+    """
+    async def send(self, req):
+        """
+        Sends the given urllib Request instance and returns an
+        AsyncResponse. Raises an exception if the request fails.
+        """
+        raise NotImplementedError()
+
+    async def close(self):
+        """Releases any resources held by the transport."""
+
+
+class AsyncioTransport(AsyncTransport):
+    """
+    A transport implementing plain HTTP/1.0 over asyncio streams. One
+    connection is used per request and closed by the server once the
+    response is complete, which avoids having to deal with chunked
+    transfer encoding.
+    """
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+
+    async def send(self, req):
+        return await asyncio.wait_for(self._send(req), self.timeout)
+
+    async def _send(self, req):
+        parts = urlsplit(req.full_url)
+        use_ssl = parts.scheme == 'https'
+        port = parts.port or (443 if use_ssl else 80)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        reader, writer = await asyncio.open_connection(
+            parts.hostname, port,
+            ssl=ssl.create_default_context() if use_ssl else None)
+        try:
+            lines = ['%s %s HTTP/1.0' % (req.get_method(), path),
+                     'Host: %s' % parts.netloc]
+            for key, val in req.header_items():
+                if key.lower() != 'host':
+                    lines.append('%s: %s' % (key, val))
+            writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            await writer.drain()
+            data = await reader.read()
+        finally:
+            writer.close()
+
+        head, _, body = data.partition(b'\r\n\r\n')
+        status_line, _, header_data = head.partition(b'\r\n')
+        try:
+            code = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise IOError('malformed HTTP status line: %r' % status_line)
+        headers = parse_headers(io.BytesIO(header_data + b'\r\n\r\n'))
+
+        return AsyncResponse(req.full_url, code, headers, body)
+
+
+class AsyncScholarQuerier(ScholarQuerier):
+    """
+    An asyncio counterpart to ScholarQuerier. search(), send_query(),
+    apply_settings(), get_num_results(), get_citation_data() and
+    save_cookies() are coroutines here, and iter_results() is an
+    asynchronous generator; parsing and result handling are inherited
+    unchanged. Pass an existing cookie jar, e.g. a ScholarQuerier's
+    cjar member, to share cookie state between queriers.
+    """
+    MAX_REDIRECTS = 5
+
+    def __init__(self, transport=None, cjar=None):
+        ScholarQuerier.__init__(self, cjar=cjar)
+        self.transport = transport or AsyncioTransport()
+        self.flights = {} # Futures of requests in flight, by cache key
+
+    async def apply_settings(self, settings):
+        """
+        Applies settings as provided by a ScholarSettings instance.
+        """
+        if settings is None or not settings.is_configured():
+            return True
+
+        self.settings = settings
+
+        if self._is_settings_applied(settings):
+            ScholarUtils.log('info', 'settings already in effect')
+            return True
+
+        html = await self._get_http_response(url=self.GET_SETTINGS_URL,
+                                             log_msg='dump of settings form HTML',
+                                             err_msg='requesting settings failed')
+        if html is None:
+            return False
+
+        url = self._get_set_settings_url(settings, html)
+        if url is None:
+            return False
+
+        html = await self._get_http_response(url=url,
+                                             log_msg='dump of settings result HTML',
+                                             err_msg='applying setttings failed')
+        if html is None:
+            return False
+
+        self._remember_settings(settings)
+        ScholarUtils.log('info', 'settings applied')
+        return True
+
+    async def search(self, query, max_articles=None):
+        """
+        This coroutine sends a search query (a ScholarQuery instance)
+        and returns a ScholarResult holding the parsed response, up to
+        max_articles articles if given, as ScholarQuerier.search()
+        does. Concurrent searches, e.g. via asyncio.gather(), don't
+        interfere with each other.
+        """
+        result = ScholarResult(query)
+
+        html = await self._get_http_response(url=result.query.get_url(),
+                                             log_msg='dump of query response HTML',
+                                             err_msg='results retrieval failed',
+                                             cache_kind=ScholarCache.KIND_RESULTS)
+        if html is None:
+            return result
+
+        result.retrieved = True
+        parser = self.Parser(self, result, max_articles)
+        start = time.time()
+        if self.parse_pool is not None:
+            # Let the event loop carry on while a worker process parses:
+            events = await asyncio.wrap_future(self.parse_pool.submit(html))
+            self.parse_pool.replay(events, parser)
+        else:
+            parser.parse(html)
+        self._count_parse(start, len(result.articles))
+
+        # As in the blocking querier, retrieve citation exports for the
+        # whole page concurrently, bounded by the configured workers.
+        slots = asyncio.Semaphore(max(1, ScholarConf.CITATION_WORKERS))
+
+        async def fetch(art):
+            async with slots:
+                await self.get_citation_data(art)
+
+        await asyncio.gather(*[fetch(art) for art in result.articles])
+        return result
+
+    async def send_query(self, query):
+        """
+        This coroutine initiates a search query (a ScholarQuery
+        instance) with subsequent parsing of the response, as
+        ScholarQuerier.send_query() does.
+        """
+        self.clear_articles()
+        self.query = query
+        result = await self.search(query)
+        self._adopt_result(query, result)
+        return result
+
+    async def iter_results(self, query, limit=None):
+        """
+        This asynchronous generator sends the given query and yields
+        the resulting ScholarArticle instances, moving on to subsequent
+        results pages as needed, as ScholarQuerier.iter_results() does.
+        Use it via "async for art in querier.iter_results(query)".
+        """
+        if limit is not None and limit <= 0:
+            return
+
+        page = copy.deepcopy(query)
+        page_size = page.num_results or ScholarConf.MAX_PAGE_RESULTS
+        start = page.start or 0
+        count = 0
+
+        while limit is None or count < limit:
+            max_articles = None
+            if limit is not None:
+                max_articles = limit - count
+                if max_articles < page_size:
+                    page.set_num_page_results(max_articles)
+            page.set_start(start)
+
+            result = await self.search(page, max_articles)
+            if result['num_results'] is not None:
+                query['num_results'] = result['num_results']
+            if len(result.articles) == 0:
+                return
+
+            for art in result.articles:
+                yield art
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+            start += page_size
+            if result['num_results'] and start >= result['num_results']:
+                return
+
+    async def get_num_results(self, query):
+        """
+        This coroutine returns the total number of results Scholar
+        reports for the given query, as ScholarQuerier.get_num_results()
+        does.
+        """
+        key = self._get_count_key(query)
+        num_results = self._get_cached_count(key)
+        if num_results is None:
+            probe = copy.deepcopy(query)
+            probe.set_num_page_results(1)
+            probe.set_start(0)
+            html = await self._get_http_response(url=probe.get_url(),
+                                                 log_msg='dump of count probe HTML',
+                                                 err_msg='count retrieval failed')
+            if html is None:
+                return None
+            num_results = self._set_cached_count(key, html)
+
+        query['num_results'] = num_results
+        return num_results
+
+    async def get_citation_data(self, article):
+        """
+        Given an article, retrieves citation link. Note, this requires that
+        you adjusted the settings to tell Google Scholar to actually
+        provide this information, *prior* to retrieving the article.
+        """
+        if article['url_citation'] is None:
+            return False
+        if article.citation_data is not None:
+            return True
+
+        ScholarUtils.log('info', 'retrieving citation export data')
+        data = await self._get_http_response(url=article['url_citation'],
+                                             log_msg='citation data response',
+                                             err_msg='requesting citation data failed',
+                                             cache_kind=ScholarCache.KIND_CITATION)
+        if data is None:
+            return False
+
+        article.set_citation_data(data)
+        if self.store is not None:
+            self.store.set_citation_data(article, data, self._get_citation_format())
+        return True
+
+    def parse(self, html):
+        """
+        This method allows parsing of provided HTML content. Unlike
+        ScholarQuerier.parse(), it does not retrieve citation data.
+        """
+        start = time.time()
+        parser = self.Parser(self)
+        parser.parse(html)
+        self._count_parse(start, len(self.articles))
+
+    async def save_cookies(self):
+        """
+        This stores the latest cookies we're using to disk, for reuse in a
+        later session.
+        """
+        return ScholarQuerier.save_cookies(self)
+
+    async def close(self):
+        """
+        Closes the underlying transport, and the resources
+        ScholarQuerier.close() releases.
+        """
+        await self.transport.close()
+        ScholarQuerier.close(self)
+
+    async def _get_http_response(self, url, log_msg=None, err_msg=None,
+                                 cache_kind=None):
+        """
+        Helper coroutine, sends HTTP request via the transport, follows
+        redirects, and returns response payload. Caching and the
+        sharing of concurrent requests for the same URL work as in
+        ScholarQuerier._get_http_response().
+        """
+        if log_msg is None:
+            log_msg = 'HTTP response data follow'
+        if err_msg is None:
+            err_msg = 'request failed'
+
+        cache_key = self._get_cache_key(url)
+        if cache_kind is not None and self.cache is not None:
+            data = self.cache.get(cache_key, cache_kind)
+            if data is not None:
+                self.metrics.incr('cache_hits')
+                ScholarUtils.log('info', 'cache hit for %s', unquote(url))
+                return data
+            self.metrics.incr('cache_misses')
+
+        flight = self.flights.get(cache_key)
+        if flight is not None:
+            self.metrics.incr('coalesced_requests')
+            ScholarUtils.log('info', 'shared in-flight request for %s', unquote(url))
+            # Shielded, so a cancelled waiter doesn't cancel the request:
+            return await asyncio.shield(flight)
+
+        flight = asyncio.ensure_future(self._fetch_http_response(
+            url, log_msg, err_msg, cache_key, cache_kind))
+        self.flights[cache_key] = flight
+        flight.add_done_callback(lambda _: self.flights.pop(cache_key, None))
+        return await asyncio.shield(flight)
+
+    async def _fetch_http_response(self, url, log_msg, err_msg, cache_key,
+                                   cache_kind):
+        """
+        Helper coroutine for _get_http_response(), retrieves and caches
+        a payload not found in the cache.
+        """
+        try:
+            ScholarUtils.log('info', 'requesting %s', unquote(url))
+
+            tries = 0
+            while True:
+                delay = self.scheduler.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                try:
+                    start = time.time()
+                    resp = await self._send_request(url)
+                    self._count_request(start, resp.body)
+                    break
+                except ThrottledError as err:
+                    if self.scheduler.backoff(err, tries) is None:
+                        raise
+                    tries += 1
+
+            if ScholarUtils.log_enabled('debug'):
+                ScholarUtils.log('debug', log_msg)
+                ScholarUtils.log('debug', '>>>>' + '-'*68)
+                ScholarUtils.log('debug', 'url: %s', resp.geturl())
+                ScholarUtils.log('debug', 'result: %s', resp.getcode())
+                ScholarUtils.log('debug', 'headers:\n%s', resp.info())
+                ScholarUtils.log('debug', 'data:\n%s', resp.body.decode('utf-8', 'replace'))
+                ScholarUtils.log('debug', '<<<<' + '-'*68)
+
+            if cache_kind is not None and self.cache is not None:
+                self.cache.put(cache_key, cache_kind, resp.body)
+            if self.archive is not None:
+                self.archive.put(url, resp.body, cache_kind)
+
+            return resp.body
+        except ThrottledError as err:
+            self.metrics.incr('request_failures')
+            ScholarUtils.log('warn', err_msg + ': %s', err)
+            return None
+        except Exception as err:
+            self.metrics.incr('request_failures')
+            ScholarUtils.log('info', err_msg + ': %s', err)
+            return None
+
+    async def _send_request(self, url):
+        """
+        Helper coroutine, sends a request via the transport, following
+        redirects, and returns the final response. Raises
+        ThrottledError if Scholar rejected the request due to our
+        request rate.
+        """
+        for _ in range(self.MAX_REDIRECTS + 1):
+            req = Request(url=url, headers={'User-Agent': ScholarConf.USER_AGENT})
+            self.cjar.add_cookie_header(req)
+            resp = await self.transport.send(req)
+            self.cjar.extract_cookies(resp, req)
+
+            location = resp.headers.get('Location')
+            if resp.code in (301, 302, 303, 307, 308) and location:
+                url = urljoin(url, location)
+                continue
+            break
+        else:
+            raise IOError('too many redirects')
+
+        if resp.code in (429, 503):
+            raise ThrottledError('HTTP %d' % resp.code,
+                                 ScholarRequestScheduler.parse_retry_after(
+                                     resp.headers.get('Retry-After')))
+        if resp.code >= 400:
+            raise IOError('HTTP Error %d' % resp.code)
+        if self._is_captcha(resp.geturl(), resp.body):
+            raise ThrottledError('CAPTCHA')
+        return resp
@@ -0,0 +1,40 @@
+"""
+Tests for scholar.py's results-page parsers. They run the parity check
+of bench/bench_parsers.py --check over the fixtures in bench/fixtures:
+every parser engine, whole-page and incremental parsing, and the
+count-only parser must yield each fixture's expected output.
+
+  python -m unittest discover tests
+"""
+# Don't complain about missing docstrings: pylint: disable-msg=C0111
+
+import glob
+import json
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'bench')
+sys.path.insert(0, BENCH_DIR)
+
+import bench_parsers # pylint: disable-msg=C0413
+
+
+class ParserFixturesTest(unittest.TestCase):
+    def test_fixtures(self):
+        fixtures = sorted(glob.glob(os.path.join(BENCH_DIR, 'fixtures', '*.html')))
+        self.assertTrue(fixtures)
+        for path in fixtures:
+            name = os.path.splitext(os.path.basename(path))[0]
+            with self.subTest(fixture=name):
+                parser_class = bench_parsers.PARSERS[name.split('-', 1)[0]]
+                with open(path, 'rb') as hdl:
+                    html = hdl.read()
+                with open(os.path.splitext(path)[0] + '.json') as hdl:
+                    expected = json.load(hdl)
+                self.assertEqual(bench_parsers.check(parser_class, html, expected), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
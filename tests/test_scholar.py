@@ -0,0 +1,173 @@
+"""
+Tests for scholar.py's ScholarQuerier. They inject a stub opener
+serving the results pages in bench/fixtures, so they run without
+network access:
+
+  python -m unittest discover tests
+"""
+# Don't complain about missing docstrings: pylint: disable-msg=C0111
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'bench', 'fixtures')
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+import scholar # pylint: disable-msg=C0413
+
+
+class StubResponse(object):
+    """
+    A response handle returning the given payload, which raises
+    IOError once fail_at bytes of it got read, if given.
+    """
+    def __init__(self, url, body, fail_at=None):
+        self.url = url
+        self.body = body
+        self.fail_at = fail_at
+        self.pos = 0
+
+    def read(self, size=-1):
+        if self.fail_at is not None and self.pos >= self.fail_at:
+            raise IOError('connection reset')
+        end = len(self.body) if size < 0 else self.pos + size
+        if self.fail_at is not None:
+            end = min(end, self.fail_at)
+        chunk = self.body[self.pos:end]
+        self.pos += len(chunk)
+        return chunk
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return 200
+
+    def info(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class StubOpener(object):
+    """
+    Serves canned payloads by URL and records the URLs requested.
+    Requests for any other URL fail, as they would hit the network.
+    """
+    def __init__(self, responses, fail_at=None):
+        self.responses = responses
+        self.fail_at = fail_at
+        self.requests = []
+
+    def open(self, req):
+        self.requests.append(req.get_full_url())
+        if req.get_full_url() not in self.responses:
+            raise IOError('unexpected request for %s' % req.get_full_url())
+        return StubResponse(req.get_full_url(), self.responses[req.get_full_url()],
+                            self.fail_at)
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name + '.html'), 'rb') as hdl:
+        html = hdl.read()
+    with open(os.path.join(FIXTURES_DIR, name + '.json')) as hdl:
+        return html, json.load(hdl)
+
+
+class ScholarQuerierTest(unittest.TestCase):
+    def setUp(self):
+        self.saved = (scholar.ScholarConf.REQUEST_RETRIES,
+                      scholar.ScholarConf.READ_CHUNK_SIZE)
+        scholar.ScholarConf.REQUEST_RETRIES = 0
+        scholar.ScholarConf.READ_CHUNK_SIZE = 1024
+        self.query = scholar.SearchScholarQuery()
+        self.query.set_words('honeypot')
+        self.querier = scholar.ScholarQuerier()
+
+    def tearDown(self):
+        self.querier.close()
+        (scholar.ScholarConf.REQUEST_RETRIES,
+         scholar.ScholarConf.READ_CHUNK_SIZE) = self.saved
+
+    def test_search_failing_partway(self):
+        html, expected = read_fixture('120726-page')
+        self.assertTrue(len(expected['articles']) > 1)
+        self.querier.opener = StubOpener({self.query.get_url(): html},
+                                         fail_at=len(html) * 3 // 4)
+
+        result = self.querier.search(self.query)
+        self.assertFalse(result.retrieved)
+        self.assertEqual(len(result), 0)
+
+    def test_iter_results_failing_partway(self):
+        html, _ = read_fixture('120726-page')
+        responses = {}
+        for start in range(0, 50, 10):
+            page = scholar.SearchScholarQuery()
+            page.set_words('honeypot')
+            page.set_start(start)
+            responses[page.get_url()] = html
+        self.querier.opener = StubOpener(responses, fail_at=len(html) * 3 // 4)
+
+        self.assertEqual(list(self.querier.iter_results(self.query, limit=50)), [])
+
+    def test_search_stops_parsing(self):
+        html, expected = read_fixture('120726-page')
+        self.querier.opener = StubOpener({self.query.get_url(): html})
+
+        result = self.querier.search(self.query, max_articles=3)
+        self.assertTrue(result.retrieved)
+        self.assertEqual([art.as_dict() for art in result],
+                         expected['articles'][:3])
+
+    def test_iter_results_stops_parsing(self):
+        html, expected = read_fixture('120726-page')
+        page = scholar.SearchScholarQuery()
+        page.set_words('honeypot')
+        page.set_num_page_results(3)
+        page.set_start(0)
+        self.querier.opener = StubOpener({page.get_url(): html})
+
+        articles = list(self.querier.iter_results(self.query, limit=3))
+        self.assertEqual(len(articles), 3)
+        # Citation exports got requested only for the articles parsed:
+        citations = [art['url_citation'] for art in expected['articles'][:3]
+                     if art['url_citation']]
+        self.assertEqual(self.querier.opener.requests[0], page.get_url())
+        self.assertEqual(sorted(self.querier.opener.requests[1:]), sorted(citations))
+
+    def test_iter_results_zero_limit(self):
+        self.querier.opener = StubOpener({})
+        self.assertEqual(list(self.querier.iter_results(self.query, limit=0)), [])
+        self.assertEqual(self.querier.opener.requests, [])
+
+
+class ReadBatchTest(unittest.TestCase):
+    def read_batch(self, suffix, data):
+        hdl, path = tempfile.mkstemp(suffix=suffix)
+        try:
+            with os.fdopen(hdl, 'w') as out:
+                out.write(data)
+            return list(scholar.read_batch(path))
+        finally:
+            os.remove(path)
+
+    def test_jsonl_flags(self):
+        args = self.read_batch('.jsonl', '{"phrase": "x", "title_only": "false", '
+                               '"no_patents": "yes", "no_citations": true}\n')
+        self.assertEqual(args, [{'phrase': 'x', 'title_only': False,
+                                 'no_patents': True, 'no_citations': True}])
+
+    def test_csv_flags(self):
+        args = self.read_batch('.csv', 'phrase,title_only,no_patents\nx,false,Yes\n')
+        self.assertEqual(args, [{'phrase': 'x', 'title_only': False,
+                                 'no_patents': True}])
+
+
+if __name__ == '__main__':
+    unittest.main()
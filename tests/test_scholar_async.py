@@ -0,0 +1,134 @@
+"""
+Tests for scholar_async.py's AsyncScholarQuerier. They inject a stub
+transport serving the results pages in bench/fixtures, so they run
+without network access:
+
+  python -m unittest discover tests
+"""
+# Don't complain about missing docstrings: pylint: disable-msg=C0111
+
+import asyncio
+import io
+import json
+import os
+import sys
+import unittest
+
+from http.client import parse_headers
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(os.path.dirname(TESTS_DIR), 'bench', 'fixtures')
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+import scholar # pylint: disable-msg=C0413
+from scholar_async import AsyncResponse, AsyncScholarQuerier, \
+    AsyncTransport # pylint: disable-msg=C0413
+
+
+class StubTransport(AsyncTransport):
+    """
+    Serves canned responses by URL and records the requests sent.
+    Requests for any other URL fail, as they would hit the network.
+    """
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    async def send(self, req):
+        self.requests.append(req)
+        if req.full_url not in self.responses:
+            raise IOError('unexpected request for %s' % req.full_url)
+        code, headers, body = self.responses[req.full_url]
+        header_data = ''.join(['%s: %s\r\n' % item for item in headers])
+        return AsyncResponse(req.full_url, code,
+                             parse_headers(io.BytesIO(header_data.encode('ascii') + b'\r\n')),
+                             body)
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name + '.html'), 'rb') as hdl:
+        html = hdl.read()
+    with open(os.path.join(FIXTURES_DIR, name + '.json')) as hdl:
+        return html, json.load(hdl)
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class AsyncScholarQuerierTest(unittest.TestCase):
+    def setUp(self):
+        self.query = scholar.SearchScholarQuery()
+        self.query.set_words('honeypot')
+        self.url = self.query.get_url()
+
+    def search(self, transport, query=None):
+        async def search():
+            querier = AsyncScholarQuerier(transport=transport)
+            try:
+                return await querier.search(query or self.query)
+            finally:
+                await querier.close()
+        return run(search())
+
+    def test_search_parses_page(self):
+        html, expected = read_fixture('120726-page')
+        responses = {self.url: (200, [], html)}
+        for art in expected['articles']:
+            if art['url_citation']:
+                responses[art['url_citation']] = (200, [], b'@article{x}')
+        transport = StubTransport(responses)
+
+        result = self.search(transport)
+        self.assertTrue(result.retrieved)
+        self.assertEqual(result['num_results'], expected['num_results'])
+        self.assertEqual(transport.requests[0].full_url, self.url)
+        self.assertEqual(len(transport.requests), len(responses))
+        self.assertEqual(self.query['num_results'], 0) # Left unchanged
+
+        articles = [art.as_dict() for art in result]
+        for art in articles:
+            self.assertEqual(art.pop('citation_data', None),
+                             '@article{x}' if art['url_citation'] else None)
+        self.assertEqual(articles, expected['articles'])
+
+    def test_redirect_carries_cookies(self):
+        html, expected = read_fixture('120726-single')
+        target = scholar.ScholarConf.SCHOLAR_SITE + '/scholar?redirected=1'
+        transport = StubTransport({
+            self.url: (302, [('Location', target),
+                             ('Set-Cookie', 'GSP=ID=1; Path=/')], b''),
+            target: (200, [], html),
+            expected['articles'][0]['url_citation']: (200, [], b'@article{x}')})
+
+        result = self.search(transport)
+        self.assertEqual(len(result), len(expected['articles']))
+        self.assertEqual(len(transport.requests), 3)
+        self.assertEqual(transport.requests[1].get_header('Cookie'), 'GSP=ID=1')
+
+    def test_failed_request(self):
+        saved = scholar.ScholarConf.REQUEST_RETRIES
+        scholar.ScholarConf.REQUEST_RETRIES = 0
+        try:
+            result = self.search(StubTransport({self.url: (500, [], b'')}))
+        finally:
+            scholar.ScholarConf.REQUEST_RETRIES = saved
+        self.assertFalse(result.retrieved)
+        self.assertEqual(len(result), 0)
+
+    def test_iter_results_zero_limit(self):
+        async def collect(querier):
+            try:
+                return [art async for art in querier.iter_results(self.query, limit=0)]
+            finally:
+                await querier.close()
+        transport = StubTransport({})
+        self.assertEqual(run(collect(AsyncScholarQuerier(transport=transport))), [])
+        self.assertEqual(transport.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()